@@ -0,0 +1,327 @@
+import json
+from datetime import datetime
+import dateutil.parser
+from flask import Blueprint, Response, current_app, request, abort, url_for
+from werkzeug.exceptions import HTTPException
+from models import db, Artist, Venue, Show
+from cache import response_cache
+from importer import allocate_ids
+import areas
+import counters
+import geo
+import queries
+import search
+
+# Fastest JSON encoder available; all are fed plain str/int/list values
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    try:
+        import ujson
+        _dumps = ujson.dumps
+    except ImportError:
+        _dumps = json.dumps
+
+
+#----------------------------------------------------------------------------#
+# Read API.
+#----------------------------------------------------------------------------#
+
+# /api/v1/ read endpoints. Every query selects only the requested columns
+# (?fields=a,b), so ORM objects are never built, and lists are paginated by
+# cursor with the same keyset helpers as the HTML listings.
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = {c: getattr(Venue, c) for c in (
+    'id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+    'facebook_link', 'genres', 'website', 'seeking_talent',
+    'seeking_description', 'upcoming_shows_count', 'past_shows_count',
+    'latitude', 'longitude')}
+
+ARTIST_FIELDS = {c: getattr(Artist, c) for c in (
+    'id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+    'facebook_link', 'seeking_venue', 'website', 'seeking_description',
+    'upcoming_shows_count', 'past_shows_count')}
+
+SHOW_FIELDS = {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'venue_id': Show.venue_id,
+    'artist_id': Show.artist_id,
+    'venue_name': Venue.name,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+}
+
+
+def jsonify_fast(payload, status=200):
+    body = _dumps(payload)
+    return Response(body, status=status, mimetype='application/json')
+
+
+@bp.errorhandler(400)
+@bp.errorhandler(404)
+@bp.errorhandler(HTTPException)
+def api_error(error):
+    # per-code handlers too, or the app's HTML 404 page would win
+    return jsonify_fast({"error": error.name, "message": error.description},
+                        error.code)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _fields(available, keys=()):
+    # Requested field names, in order; unknown names are a 400
+    requested = request.args.get('fields')
+    names = requested.split(',') if requested else list(available)
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        abort(400, 'unknown fields: ' + ', '.join(unknown))
+    # sort keys are always selected, they build the next/prev cursors
+    columns = [available[n].label(n) for n in names]
+    columns += [available[k].label(k) for k in keys if k not in names]
+    return names, columns
+
+
+def _page_args(cursor_types):
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    args = {"limit": max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))}
+    try:
+        for name in ('after', 'before'):
+            if request.args.get(name):
+                args[name] = queries.decode_cursor(
+                    request.args[name], cursor_types)
+    except ValueError:
+        abort(400, 'malformed cursor')
+    return args
+
+
+def _list(query, names, sort_columns, cursor_types):
+    page = queries.keyset_page(query, sort_columns, **_page_args(cursor_types))
+    return jsonify_fast({
+        "data": [{n: _plain(getattr(r, n)) for n in names}
+                 for r in page["items"]],
+        "next": page["next"],
+        "prev": page["prev"],
+    })
+
+
+def _detail(model, available, id):
+    names, columns = _fields(available)
+    row = db.session.query(*columns).filter(model.id == id).first()
+    if row is None:
+        abort(404)
+    return jsonify_fast({"data": {n: _plain(getattr(row, n)) for n in names}})
+
+
+def _search(kind):
+    # ?q=&genre=&genre=...: matches with all the genres, and per-genre counts
+    result = search.search(kind, request.args.get('q', ''),
+                           page=request.args.get('page', 1, type=int),
+                           genres=request.args.getlist('genre'))
+    return jsonify_fast(result)
+
+
+@bp.route('/venues')
+def venues():
+    names, columns = _fields(VENUE_FIELDS, keys=('id',))
+    return _list(db.session.query(*columns), names, (Venue.id,), (int,))
+
+
+@bp.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return _detail(Venue, VENUE_FIELDS, venue_id)
+
+
+@bp.route('/venues/search')
+def search_venues():
+    return _search('venue')
+
+
+def _near_row(row, latitude=None, longitude=None):
+    data = {"id": row.id, "name": row.name, "city": row.city,
+            "state": row.state, "latitude": row.latitude,
+            "longitude": row.longitude,
+            "num_upcoming_shows": row.num_upcoming_shows}
+    if latitude is not None:
+        data["distance_km"] = round(geo.distance_km(
+            latitude, longitude, row.latitude, row.longitude), 3)
+    return data
+
+
+@bp.route('/venues/near')
+def venues_near():
+    """Venues around a point, nearest first, with their upcoming show
+    counts: ?lat=&lng=&radius_km=[10]&limit=. Or every venue in a box,
+    paginated by id: ?bbox=west,south,east,north."""
+    config = current_app.config
+    if request.args.get('bbox'):
+        try:
+            west, south, east, north = [
+                float(v) for v in request.args['bbox'].split(',')]
+        except ValueError:
+            abort(400, 'bbox is west,south,east,north')
+        if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+            abort(400, 'bbox out of range (or crossing the antimeridian)')
+        if max(east - west, north - south) > config['GEO_MAX_BOX_DEGREES']:
+            abort(400, 'bbox larger than {} degrees'.format(
+                config['GEO_MAX_BOX_DEGREES']))
+        page = queries.keyset_page(
+            queries.venues_in_box(south, west, north, east), (Venue.id,),
+            **_page_args((int,)))
+        return jsonify_fast({"data": [_near_row(r) for r in page["items"]],
+                             "next": page["next"], "prev": page["prev"]})
+
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    radius = request.args.get('radius_km', 10.0, type=float)
+    if latitude is None or longitude is None:
+        abort(400, 'lat and lng (or bbox) are required')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        abort(400, 'lat/lng out of range')
+    if not 0 < radius <= config['GEO_MAX_RADIUS_KM']:
+        abort(400, 'radius_km must be in (0, {}]'.format(
+            config['GEO_MAX_RADIUS_KM']))
+    limit = request.args.get('limit', config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, config['MAX_PAGE_SIZE']))
+    rows = queries.venues_near(latitude, longitude, radius).limit(limit).all()
+    return jsonify_fast({"data": [_near_row(r, latitude, longitude)
+                                  for r in rows]})
+
+
+@bp.route('/artists')
+def artists():
+    names, columns = _fields(ARTIST_FIELDS, keys=('id',))
+    return _list(db.session.query(*columns), names, (Artist.id,), (int,))
+
+
+@bp.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return _detail(Artist, ARTIST_FIELDS, artist_id)
+
+
+@bp.route('/artists/search')
+def search_artists():
+    return _search('artist')
+
+
+def _shows_query(columns):
+    query = db.session.query(*columns).select_from(Show)
+    names = {c.key for c in columns}
+    if names & {'venue_name'}:
+        query = query.join(Venue, Venue.id == Show.venue_id)
+    if names & {'artist_name', 'artist_image_link'}:
+        query = query.join(Artist, Artist.id == Show.artist_id)
+    return query
+
+
+@bp.route('/shows')
+def shows():
+    # ?venue_id= / ?artist_id= use the (fk, start_time) indexes
+    names, columns = _fields(SHOW_FIELDS, keys=('start_time', 'id'))
+    query = _shows_query(columns)
+    for fk in ('venue_id', 'artist_id'):
+        value = request.args.get(fk, type=int)
+        if value is not None:
+            query = query.filter(SHOW_FIELDS[fk] == value)
+    return _list(query, names, (Show.start_time, Show.id), (datetime, int))
+
+
+@bp.route('/shows/<int:show_id>')
+def show(show_id):
+    names, columns = _fields(SHOW_FIELDS)
+    row = _shows_query(columns).filter(Show.id == show_id).first()
+    if row is None:
+        abort(404)
+    return jsonify_fast({"data": {n: _plain(getattr(row, n)) for n in names}})
+
+
+#----------------------------------------------------------------------------#
+# Batch writes.
+#----------------------------------------------------------------------------#
+
+
+def _parse_show(raw):
+    # (row, None) or (None, error message)
+    if not isinstance(raw, dict):
+        return None, 'expected an object'
+    try:
+        artist_id, venue_id = int(raw['artist_id']), int(raw['venue_id'])
+        start_time = dateutil.parser.parse(str(raw['start_time']))
+    except KeyError as e:
+        return None, 'missing ' + e.args[0]
+    except (TypeError, ValueError, OverflowError):
+        return None, 'invalid artist_id, venue_id or start_time'
+    return {"artist_id": artist_id, "venue_id": venue_id,
+            "start_time": start_time}, None
+
+
+@bp.route('/shows/batch', methods=['POST'])
+def create_shows_batch():
+    """Create many shows at once: {"shows": [{artist_id, venue_id,
+    start_time}, ...]}. Every referenced artist/venue is checked with one
+    IN (...) query per table and all valid rows go in one transaction, so
+    the number of round trips doesn't grow with the batch."""
+    payload = request.get_json(silent=True)
+    shows = payload.get('shows') if isinstance(payload, dict) else payload
+    if not isinstance(shows, list):
+        abort(400, 'expected {"shows": [...]}')
+    if len(shows) > current_app.config['MAX_BATCH_SHOWS']:
+        abort(400, 'at most {} shows per batch'.format(
+            current_app.config['MAX_BATCH_SHOWS']))
+
+    parsed = [_parse_show(raw) for raw in shows]
+    rows = [row for row, _ in parsed if row]
+    artist_ids = {r["artist_id"] for r in rows}
+    venue_ids = {r["venue_id"] for r in rows}
+    known_artists = {id for id, in db.session.query(Artist.id).filter(
+        Artist.id.in_(artist_ids))} if artist_ids else set()
+    known_venues = {id for id, in db.session.query(Venue.id).filter(
+        Venue.id.in_(venue_ids))} if venue_ids else set()
+
+    results, valid = [], []
+    for index, (row, error) in enumerate(parsed):
+        if row and row["artist_id"] not in known_artists:
+            error = 'unknown artist_id {}'.format(row["artist_id"])
+        elif row and row["venue_id"] not in known_venues:
+            error = 'unknown venue_id {}'.format(row["venue_id"])
+        if error:
+            results.append({"index": index, "status": "error",
+                            "error": error})
+        else:
+            results.append({"index": index, "status": "created"})
+            valid.append((results[-1], row))
+
+    if valid:
+        table = Show.__table__
+        now, stamp = datetime.now(), datetime.utcnow()
+        try:
+            connection = db.session.connection()
+            ids = allocate_ids(connection, table, len(valid))
+            for id, (result, row) in zip(ids, valid):
+                row.update(id=id, updated_at=stamp)
+                result["id"] = id
+            counters.add_shows([row for _, row in valid], now)
+            connection.execute(table.insert(), [row for _, row in valid])
+            areas.refresh({row["venue_id"] for _, row in valid}, now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        response_cache.invalidate(
+            url_for('shows'), url_for('venues'),
+            *[url_for('show_venue', venue_id=id) for id in
+              {row["venue_id"] for _, row in valid}] +
+            [url_for('show_artist', artist_id=id) for id in
+             {row["artist_id"] for _, row in valid}])
+
+    return jsonify_fast({
+        "created": len(valid),
+        "failed": len(results) - len(valid),
+        "results": results,
+    }, 201 if valid else 200)
@@ -1,36 +1,71 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
+import os
 import sys
 import json
+import tempfile
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from functools import lru_cache
+from datetime import datetime
+from flask import Flask, current_app, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context
 from flask_moment import Moment
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 #----------------------------------------------------------------------------#
-from config import SQLALCHEMY_DATABASE_URI
 from flask_migrate import Migrate
 from models import db, Artist, Venue, Show
+import queries
+import areas
+import assets
+import counters
+import facets
+import geo
+import search
+import cli
+import dbpool
+import instrumentation
+import api
+from cache import response_cache, conditional
+from thumbnails import thumbnails
 
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
+moment = Moment()
+migrate = Migrate()
 
+# Controllers are collected here at import and added to every app that
+# create_app() builds, under their function names as endpoints.
+_routes = []
 
-app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-migrate = Migrate(app, db)
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+class TemplateCache(FileSystemBytecodeCache):
+    # Compiled templates on disk (TEMPLATE_CACHE_DIR, filled at build time by
+    # `flask compile-templates`), so a new worker loads them instead of
+    # parsing the sources. Files are written under a temporary name and
+    # renamed: workers filling the cache at once never read half a file.
+
+    def dump_bytecode(self, bucket):
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            bucket.write_bytecode(f)
+        os.replace(tmp, self._get_cache_filename(bucket))
 
 
 #----------------------------------------------------------------------------#
@@ -38,23 +73,82 @@ migrate = Migrate(app, db)
 #----------------------------------------------------------------------------#
 
 
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def datetime_formatter(format, locale):
+    # Parse the babel pattern and locale once per (format, locale)
+    pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+    return pattern, babel.Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale):
+    pattern, locale = datetime_formatter(format, locale)
+    return pattern.apply(value, locale)
+
+
 def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+    # Accepts datetimes directly; strings are still parsed for old callers
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    return _format_datetime(value, format, babel.dates.LC_TIME or 'en_US')
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+
+def page_args(cursor_types):
+    # ?after=<cursor> / ?before=<cursor> / ?limit=<n> for keyset pagination
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    args = {"limit": max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))}
+    try:
+        for name in ('after', 'before'):
+            if request.args.get(name):
+                args[name] = queries.decode_cursor(
+                    request.args[name], cursor_types)
+    except ValueError:
+        abort(400)
+    return args
+
+
+def stream_template(template_name, **context):
+    # Render a template chunk by chunk as its row generators are consumed
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(current_app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream))
+
+
+def venue_pages(venue_id):
+    # Cached pages that show this venue's name, shows or counts
+    artist_ids = db.session.query(Show.artist_id).filter(
+        Show.venue_id == venue_id).distinct()
+    return [url_for('venues'), url_for('shows'),
+            url_for('show_venue', venue_id=venue_id)] + \
+        [url_for('show_artist', artist_id=a_id) for a_id, in artist_ids]
+
+
+def artist_pages(artist_id):
+    # Cached pages that show this artist's name, image or shows
+    venue_ids = db.session.query(Show.venue_id).filter(
+        Show.artist_id == artist_id).distinct()
+    return [url_for('artists'), url_for('shows'),
+            url_for('show_artist', artist_id=artist_id)] + \
+        [url_for('show_venue', venue_id=v_id) for v_id, in venue_ids]
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@route('/')
 def index():
     return render_template('pages/home.html')
 
@@ -62,96 +156,51 @@ def index():
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues')
+@route('/venues')
+@conditional(lambda: queries.listing_version(Venue, Show))
+@response_cache.cached
 def venues():
-    data = []
-    venues = []
-    prev_city, prev_state = None, None
-    time_now = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
-
-    for v in Venue.query.order_by(Venue.city, Venue.state).all():
-        # Querying all shows of the current venue
-        upcoming_shows = Show.query.filter(Show.venue_id == v.id).filter(
-            Show.start_time > time_now).all()
-
-        # Checking for duplicate city, state pairs
-        if prev_city != None and prev_state != None:
-            if v.city != prev_city or v.state != prev_state:
-                # If new city, state pair is queried, append the prev pair
-                data.append({
-                    "city": prev_city,
-                    "state": prev_state,
-                    "venues": venues
-                })
-
-                venues = []
-
-            venues.append({
-                "id": v.id,
-                "name": v.name,
-                "num_upcoming_shows": len(upcoming_shows)
-            })
+    # Venues grouped by city/state, upcoming shows counted in one query
+    if current_app.config['STREAM_LISTINGS']:
+        return stream_template('pages/venues.html',
+                               areas=queries.iter_venue_areas())
+    return render_template('pages/venues.html', areas=queries.venue_areas())
 
-        prev_city, prev_state = v.city, v.state
 
-    return render_template('pages/venues.html', areas=data)
-
-
-@app.route('/venues/search', methods=['POST'])
+@route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-    keyword = request.form.get('search_term')
-    findings = Venue.query.filter(
-        Venue.name.ilike("%{}%".format(keyword))).all()
-
-    response = {"count": len(findings)}
-    response["data"] = []
-    time_now = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
+    term = request.values.get('search_term', '')
+    response = search.search(
+        'venue', term, page=request.values.get('page', 1, type=int),
+        genres=request.values.getlist('genre'))
 
-    for f in findings:
-        upcoming_shows = Show.query.filter(Show.venue_id == f.id).filter(
-            Show.start_time > time_now).all()
+    return render_template('pages/search_venues.html', results=response, search_term=term)
 
-        response["data"].append({
-            "id": f.id,
-            "name": f.name,
-            "num_upcoming_shows": len(upcoming_shows)
-        })
 
-    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-
-@app.route('/venues/<int:venue_id>')
+@route('/venues/<int:venue_id>')
+@conditional(queries.venue_version)
+@response_cache.cached
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
+    v = queries.venue_with_shows(venue_id)
+    if v is None:
+        abort(404)
+
+    past_shows, upcoming_shows = queries.split_shows(v.shows, other='artists')
+    past_shows_data, upcoming_shows_data = [
+        [{
+            "artist_id": s.artists.id,
+            "artist_name": s.artists.name,
+            "artist_image_link": s.artists.image_link,
+            "start_time": s.start_time
+        } for s in shows] for shows in (past_shows, upcoming_shows)]
 
-    time_now = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
-    v = Venue.query.filter(Venue.id == venue_id).first()
+    return render_template('pages/show_venue.html',
+                           venue=venue_data(v, past_shows_data, upcoming_shows_data))
 
-    # PAST SHOWS DATA
-    past_shows = Show.query.join(Artist).filter(Show.venue_id == v.id).filter(
-        Show.start_time < time_now).all()
-    past_shows_data = []
-    for p in past_shows:
-        past_shows_data.append({
-            "artist_id": p.artists.id,
-            "artist_name": p.artists.name,
-            "artist_image_link": p.artists.image_link,
-            "start_time": str(p.start_time)
-        })
-
-    # UPCOMING SHOWS DATA
-    upcoming_shows = Show.query.join(Artist).filter(Show.venue_id == v.id).filter(
-        Show.start_time > time_now).all()
-    upcoming_shows_data = []
-    for u in upcoming_shows:
-        upcoming_shows_data.append({
-            "artist_id": u.artists.id,
-            "artist_name": u.artists.name,
-            "artist_image_link": u.artists.image_link,
-            "start_time": str(u.start_time)
-        })
-
-    data = {
+
+def venue_data(v, past_shows_data, upcoming_shows_data):
+    return {
         "id": v.id,
         "name": v.name,
         "genres": v.genres,
@@ -166,29 +215,28 @@ def show_venue(venue_id):
         "image_link": v.image_link,
         "past_shows": past_shows_data,
         "upcoming_shows": upcoming_shows_data,
-        "past_shows_count": len(past_shows),
-        "upcoming_shows_count": len(upcoming_shows),
+        "past_shows_count": len(past_shows_data),
+        "upcoming_shows_count": len(upcoming_shows_data),
     }
-    return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@route('/venues/create', methods=['POST'])
 def create_venue_submission():
     name = request.form.get('name')
     city = request.form.get('city')
     state = request.form.get('state')
     address = request.form.get('address')
     phone = request.form.get('phone')
-    genres = request.form.get('genres')
+    genres = request.form.getlist('genres')
     facebook_link = request.form.get('facebook_link')
     seeking_talent = request.form.get('seeking_talent')
     seeking_description = request.form.get('seeking_description')
@@ -200,10 +248,16 @@ def create_venue_submission():
             address=address, phone=phone, genres=genres,
             facebook_link=facebook_link, seeking_talent=True if(
                 seeking_talent == "Yes") else False,
-            seeking_description=seeking_description, website=website
+            seeking_description=seeking_description, website=website,
+            **geo.position(city, state)
         )
         db.session.add(v)
+        db.session.flush()
+        areas.refresh([v.id])
+        facets.refresh(Venue, [v.id])
         db.session.commit()
+        search.index(v)
+        response_cache.invalidate(url_for('venues'))
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] +
               ' was successfully listed!')
@@ -215,83 +269,72 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
     v = Venue.query.filter(Venue.id == venue_id).first()
+    if v is None:
+        abort(404)
+    pages = venue_pages(v.id)
     db.session.delete(v)
+    areas.refresh([v.id])
+    queries.record_deletion(Venue)
+    facets.refresh(Venue, [v.id])
     db.session.commit()
-    return None
+    response_cache.invalidate(*pages)
+    search.unindex(Venue, v.id)
+    return '', 204
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@route('/artists')
+@conditional(lambda: queries.listing_version(Artist))
+@response_cache.cached
 def artists():
-    data = []
+    if current_app.config['STREAM_LISTINGS']:
+        data = ({"id": a.id, "name": a.name} for a in queries.iter_artists())
+        return stream_template('pages/artists.html', artists=data)
 
-    for a in Artist.query.all():
-        data.append({
-            "id": a.id,
-            "name": a.name
-        })
+    page = queries.artists_page(**page_args((int,)))
+    data = [{"id": a.id, "name": a.name} for a in page["items"]]
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, page=page)
 
 
-@app.route('/artists/search', methods=['POST'])
+@route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-    keyword = request.form.get('search_term')
-    findings = Artist.query.filter(
-        Artist.name.ilike("%{}%".format(keyword))).all()
+    term = request.values.get('search_term', '')
+    response = search.search(
+        'artist', term, page=request.values.get('page', 1, type=int),
+        genres=request.values.getlist('genre'))
 
-    response = {"count": len(findings)}
-    response["data"] = []
-    time_now = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
+    return render_template('pages/search_artists.html', results=response, search_term=term)
 
-    for f in findings:
-        upcoming_shows = Show.query.filter(Show.venue_id == f.id).filter(
-            Show.start_time > time_now).all()
 
-        response["data"].append({
-            "id": f.id,
-            "name": f.name,
-            "num_upcoming_shows": len(upcoming_shows)
-        })
+@route('/artists/<int:artist_id>')
+@conditional(queries.artist_version)
+@response_cache.cached
+def show_artist(artist_id):
+    # shows the artist page with the given artist_id
+    a = queries.artist_with_shows(artist_id)
+    if a is None:
+        abort(404)
+
+    past_shows, upcoming_shows = queries.split_shows(a.shows, other='venues')
+    past_shows_data, upcoming_shows_data = [
+        [{
+            "venue_id": s.venues.id,
+            "venue_name": s.venues.name,
+            "venue_image_link": s.venues.image_link,
+            "start_time": s.start_time
+        } for s in shows] for shows in (past_shows, upcoming_shows)]
 
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    return render_template('pages/show_artist.html',
+                           artist=artist_data(a, past_shows_data, upcoming_shows_data))
 
 
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-    # shows the venue page with the given venue_id
-    time_now = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
-    a = Artist.query.filter(Artist.id == artist_id).first()
-
-    # PAST SHOWS DATA
-    past_shows = Show.query.join(Venue).filter(Show.artist_id == a.id).filter(
-        Show.start_time < time_now).all()
-    past_shows_data = []
-    for p in past_shows:
-        past_shows_data.append({
-            "venue_id": p.venues.id,
-            "venue_name": p.venues.name,
-            "venue_image_link": p.venues.image_link,
-            "start_time": str(p.start_time)
-        })
-
-    # UPCOMING SHOWS DATA
-    upcoming_shows = Show.query.join(Venue).filter(Show.artist_id == a.id).filter(
-        Show.start_time > time_now).all()
-    upcoming_shows_data = []
-    for u in upcoming_shows:
-        upcoming_shows_data.append({
-            "venue_id": u.venues.id,
-            "venue_name": u.venues.name,
-            "venue_image_link": u.venues.image_link,
-            "start_time": str(u.start_time)
-        })
-
-    data = {
+def artist_data(a, past_shows_data, upcoming_shows_data):
+    return {
         "id": a.id,
         "name": a.name,
         "genres": a.genres,
@@ -305,15 +348,13 @@ def show_artist(artist_id):
         "image_link": a.image_link,
         "past_shows": past_shows_data,
         "upcoming_shows": upcoming_shows_data,
-        "past_shows_count": len(past_shows),
-        "upcoming_shows_count": len(upcoming_shows),
+        "past_shows_count": len(past_shows_data),
+        "upcoming_shows_count": len(upcoming_shows_data),
     }
 
-    return render_template('pages/show_artist.html', artist=data)
-
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
     a = Artist.query.filter(Artist.id == artist_id).first()
@@ -335,7 +376,7 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
     artist = Artist.query.filter(Artist.id == artist_id).first()
@@ -343,7 +384,7 @@ def edit_artist_submission(artist_id):
     name = request.form.get('name')
     city = request.form.get('city')
     phone = request.form.get('phone')
-    genres = request.form.get('genres')
+    genres = ','.join(request.form.getlist('genres'))
     facebook_link = request.form.get('facebook_link')
     website = request.form.get('website')
     seeking_venue = request.form.get('facebook_link')
@@ -358,13 +399,22 @@ def edit_artist_submission(artist_id):
     artist.seeking_venue = True if(
         seeking_venue == "Yes") else False
     artist.seeking_description = seeking_description
+    image_link = request.form.get('image_link')
+    image_changed = bool(image_link) and image_link != artist.image_link
+    if image_changed:
+        artist.image_link = image_link
 
+    facets.refresh(Artist, [artist.id])
     db.session.commit()
+    search.index(artist)
+    response_cache.invalidate(*artist_pages(artist.id))
+    if image_changed:
+        thumbnails.refresh(image_link)
 
     return redirect(url_for('show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
     v = Venue.query.filter(Venue.id == venue_id).first()
@@ -387,7 +437,7 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     # venue record with ID <venue_id> using the new attributes
     venue = Venue.query.filter(Venue.id == venue_id).first()
@@ -397,11 +447,12 @@ def edit_venue_submission(venue_id):
     state = request.form.get('state')
     address = request.form.get('address')
     phone = request.form.get('phone')
-    genres = request.form.get('genres')
+    genres = request.form.getlist('genres')
     facebook_link = request.form.get('facebook_link')
     website = request.form.get('website')
     seeking_talent = request.form.get('seeking_talent')
     seeking_description = request.form.get('seeking_description')
+    moved = (city, state) != (venue.city, venue.state)
 
     venue.name = name
     venue.city = city
@@ -414,8 +465,20 @@ def edit_venue_submission(venue_id):
     venue.seeking_talent = True if(
         seeking_talent == "Yes") else False
     venue.seeking_description = seeking_description
-
+    if moved:
+        geo.locate(venue)
+    image_link = request.form.get('image_link')
+    image_changed = bool(image_link) and image_link != venue.image_link
+    if image_changed:
+        venue.image_link = image_link
+
+    areas.refresh([venue.id])
+    facets.refresh(Venue, [venue.id])
     db.session.commit()
+    search.index(venue)
+    response_cache.invalidate(*venue_pages(venue.id))
+    if image_changed:
+        thumbnails.refresh(image_link)
 
     return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -423,20 +486,20 @@ def edit_venue_submission(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
+@route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
     name = request.form.get('name')
     city = request.form.get('city')
     state = request.form.get('state')
     phone = request.form.get('phone')
-    genres = request.form.get('genres')
+    genres = ','.join(request.form.getlist('genres'))
     facebook_link = request.form.get('facebook_link')
     website = request.form.get('website')
     seeking_venue = request.form.get('seeking_venue')
@@ -451,7 +514,11 @@ def create_artist_submission():
         )
 
         db.session.add(a)
+        db.session.flush()
+        facets.refresh(Artist, [a.id])
         db.session.commit()
+        search.index(a)
+        response_cache.invalidate(url_for('artists'))
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
@@ -465,43 +532,58 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+def show_row(s):
+    return {
+        "venue_id": s.venue_id,
+        "venue_name": s.venue_name,
+        "artist_id": s.artist_id,
+        "artist_name": s.artist_name,
+        "artist_image_link": s.artist_image_link,
+        "start_time": s.start_time
+    }
+
+
+@route('/shows')
+@conditional(lambda: queries.listing_version(Show, Venue, Artist))
+@response_cache.cached
 def shows():
-    # displays list of shows at /shows
-    shows = Show.query.join(Venue).join(Artist).all()
-    data = []
+    # displays one page of shows at /shows, ordered by start time
+    if current_app.config['STREAM_LISTINGS']:
+        data = (show_row(s) for s in queries.iter_shows())
+        return stream_template('pages/shows.html', shows=data)
 
-    for s in shows:
-        data.append({
-            "venue_id": s.venues.id,
-            "venue_name": s.venues.name,
-            "artist_id": s.artist_id,
-            "artist_name": s.artists.name,
-            "artist_image_link": s.artists.image_link,
-            "start_time": str(s.start_time)
-        })
+    page = queries.shows_page(**page_args((datetime, int)))
+    data = [show_row(s) for s in page["items"]]
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data, page=page)
 
 
-@app.route('/shows/create')
+@route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     try:
-        a_id = request.form.get('artist_id')
-        v_id = request.form.get('venue_id')
-        start_time = request.form.get('start_time')
-
-        s = Show(artist_id=a_id, venue_id=v_id, start_time=start_time)
+        row = {
+            "artist_id": int(request.form.get('artist_id')),
+            "venue_id": int(request.form.get('venue_id')),
+            "start_time": dateutil.parser.parse(request.form.get('start_time')),
+        }
+        counters.add_shows([row])
+
+        s = Show(**row)
         db.session.add(s)
+        areas.refresh([s.venue_id])
         db.session.commit()
+        response_cache.invalidate(
+            url_for('shows'), url_for('venues'),
+            url_for('show_venue', venue_id=s.venue_id),
+            url_for('show_artist', artist_id=s.artist_id))
 
         # on successful db insert, flash success
         flash('Show was successfully listed!')
@@ -511,26 +593,69 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+
+def create_app(config='config'):
+    # config: anything app.config.from_object takes, or a dict of overrides
+    # on top of config.py. Nothing here connects to the database.
+    app = Flask(__name__)
+    if isinstance(config, dict):
+        app.config.from_object('config')
+        app.config.from_mapping(config)
+    else:
+        app.config.from_object(config)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if app.config['TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=TemplateCache(
+            app.config['TEMPLATE_CACHE_DIR']))
+
+    moment.init_app(app)
+    dbpool.init_app(app, db)
+    instrumentation.init_app(app)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    app.cli.add_command(cli.check_indexes)
+    app.cli.add_command(cli.import_data)
+    app.cli.add_command(cli.refresh_areas)
+    app.cli.add_command(cli.refresh_genres)
+    app.cli.add_command(cli.rollover_shows)
+    app.cli.add_command(cli.check_counters)
+    app.cli.add_command(cli.compile_templates)
+    app.cli.add_command(cli.build_assets)
+    response_cache.init_app(app)
+    assets.init_app(app)
+    thumbnails.init_app(app)
+    app.register_blueprint(api.bp)
+
+    app.jinja_env.filters['datetime'] = format_datetime
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.register_error_handler(404, not_found_error)
+    app.register_error_handler(500, server_error)
+
+    if not app.debug and app.config['ERROR_LOG']:
+        file_handler = FileHandler(app.config['ERROR_LOG'])
+        file_handler.setFormatter(
+            Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+    return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -538,11 +663,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
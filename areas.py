@@ -0,0 +1,74 @@
+from datetime import datetime
+from sqlalchemy import and_, func
+from models import db, Show, Venue, VenueArea
+
+
+#----------------------------------------------------------------------------#
+# Venue area summary.
+#----------------------------------------------------------------------------#
+
+# /venues renders from VenueArea, one precomputed row per venue with its
+# city/state, name and upcoming show count, read in index order. Writers
+# call refresh() with the venues they touched, in the same transaction, so
+# the summary never lags a committed change. A count only goes stale when
+# an upcoming show starts; next_rollover records when that happens and the
+# read recounts those few rows on the fly (see queries.venue_areas_query).
+# A plain table rather than a materialized view because it can be updated
+# a venue at a time instead of all at once.
+
+
+def _summary_select(now, venue_ids=None):
+    upcoming = and_(Show.venue_id == Venue.id, Show.start_time > now)
+    query = db.select([
+        Venue.id, Venue.city, Venue.state, Venue.name,
+        func.count(Show.id), func.min(Show.start_time)])\
+        .select_from(Venue.__table__.outerjoin(Show.__table__, upcoming))\
+        .group_by(Venue.id, Venue.city, Venue.state, Venue.name)
+    if venue_ids is not None:
+        query = query.where(Venue.id.in_(venue_ids))
+    return query
+
+
+def _fill(executor, now, venue_ids=None):
+    table = VenueArea.__table__
+    executor.execute(table.insert().from_select(
+        ['venue_id', 'city', 'state', 'name', 'num_upcoming_shows',
+         'next_rollover'],
+        _summary_select(now, venue_ids)))
+
+
+def refresh(venue_ids, now=None, executor=None):
+    """Recompute the rows of these venues; deleted venues lose theirs.
+
+    Runs on the session's transaction unless given a connection, so call it
+    before the commit that changes the venues or their shows.
+    """
+    venue_ids = sorted({int(id) for id in venue_ids if id is not None})
+    if not venue_ids:
+        return
+    now = now or datetime.now()
+    if executor is None:
+        # Session.execute doesn't autoflush: send pending venue/show changes
+        db.session.flush()
+        executor = db.session
+    table = VenueArea.__table__
+    executor.execute(table.delete().where(table.c.venue_id.in_(venue_ids)))
+    _fill(executor, now, venue_ids)
+
+
+def rebuild(now=None, executor=None):
+    # The whole summary from scratch, e.g. after loading data by hand
+    now = now or datetime.now()
+    executor = executor or db.session
+    executor.execute(VenueArea.__table__.delete())
+    _fill(executor, now)
+
+
+def refresh_rolled_over(now=None, executor=None):
+    # Persist the recounts the read does for rows whose next show started
+    now = now or datetime.now()
+    executor = executor or db.session
+    stale = [id for id, in executor.execute(
+        db.select([VenueArea.venue_id]).where(VenueArea.next_rollover <= now))]
+    refresh(stale, now, executor)
+    return len(stale)
@@ -0,0 +1,422 @@
+import asyncio
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from flask import render_template, request, session
+from sqlalchemy.dialects.postgresql import psycopg2 as pg_dialect
+from sqlalchemy.engine.url import make_url
+from werkzeug.exceptions import HTTPException
+from app import create_app, artist_data, page_args, show_row, venue_data
+from cache import validated_response
+from dbrouting import REPLICA, pinned_to_primary
+from models import db, Artist, Show, Venue
+import queries
+import search
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#----------------------------------------------------------------------------#
+
+# uvicorn asgi:application --workers 4
+#
+# The read pages (listings, venue/artist pages, search) are served by
+# coroutines that send all of a page's queries at once and render when the
+# last one returns: a venue page's validator, venue row, past shows and
+# upcoming shows take one round trip instead of four, and a worker keeps
+# serving other requests while they are in flight. Queries go through
+# asyncpg on Postgres (reading from the replica bind when there is one);
+# without asyncpg they run on a thread pool, still concurrently. Everything
+# else -- forms, writes, the API, static files, pages with flashed messages
+# and browsers pinned to the primary after a write -- is handed to the
+# Flask app on the same thread pool, unchanged.
+#
+# Query objects are built with the usual query functions and only compiled
+# here. Flask's request context is thread-local, so it is pushed around
+# synchronous steps only (parsing arguments, rendering), never across an
+# await.
+
+
+class Row(tuple):
+    # An asyncpg Record as a tuple with attribute access, like a SQLAlchemy row
+
+    def __new__(cls, record):
+        row = tuple.__new__(cls, record.values())
+        row._index = {key: i for i, key in enumerate(record.keys())}
+        return row
+
+    def __getattr__(self, name):
+        try:
+            return self[self._index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def keys(self):
+        return list(self._index)
+
+
+_DIALECT = pg_dialect.dialect()
+# What a connected dialect decides for standard_conforming_strings = on (the
+# default since Postgres 9.1): ESCAPE '\' must not be doubled
+_DIALECT._backslash_escapes = False
+_PARAMS = re.compile(r'%\(([^)]+)\)s|%%')
+
+
+def asyncpg_sql(statement):
+    # Compile for Postgres and turn %(name)s placeholders into $1, $2, ...
+    compiled = statement.compile(dialect=_DIALECT)
+    names = []
+
+    def placeholder(match):
+        if match.group(1) is None:
+            return '%'
+        names.append(match.group(1))
+        return '${}'.format(len(names))
+
+    sql = _PARAMS.sub(placeholder, str(compiled))
+    return sql, [compiled.params[name] for name in names]
+
+
+def _read_url(config):
+    return (config.get('SQLALCHEMY_BINDS') or {}).get(REPLICA) or \
+        config['SQLALCHEMY_DATABASE_URI']
+
+
+class AsyncpgDatabase(object):
+
+    def __init__(self, config):
+        url = _read_url(config)
+        self.dsn = 'postgresql://' + url.split('://', 1)[1]
+        self.size = config['ASYNC_DB_POOL_SIZE']
+        self.settings = {}
+        if config['DB_STATEMENT_TIMEOUT']:
+            self.settings['statement_timeout'] = str(config['DB_STATEMENT_TIMEOUT'])
+        self.pool = None
+
+    async def start(self):
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=1, max_size=self.size,
+            server_settings=self.settings)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def fetch(self, statement):
+        sql, params = asyncpg_sql(statement)
+        async with self.pool.acquire() as connection:
+            return [Row(r) for r in await connection.fetch(sql, *params)]
+
+
+class ThreadedDatabase(object):
+    # Fallback: each statement on a pool thread, through the SQLAlchemy engine
+
+    def __init__(self, config, executor):
+        self.bind = REPLICA if REPLICA in (config.get('SQLALCHEMY_BINDS') or {}) \
+            else None
+        self.executor = executor
+        self.engine = None
+
+    async def start(self):
+        with app.app_context():
+            self.engine = db.get_engine(app, bind=self.bind)
+
+    async def close(self):
+        pass
+
+    async def fetch(self, statement):
+        def run():
+            with self.engine.connect() as connection:
+                return connection.execute(statement).fetchall()
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, run)
+
+
+def _statement(query):
+    return getattr(query, 'statement', query)
+
+
+def _dict(row):
+    return {key: getattr(row, key) for key in row.keys()}
+
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+# Each view builds its statements inside a request context, awaits them
+# together and returns a function that renders inside a fresh one.
+# Returning None hands the request to the Flask app instead.
+
+
+async def venues(server, environ):
+    now = datetime.now()
+    with app.request_context(environ):
+        statements = [queries.listing_version_query(Venue, Show, now=now),
+                      queries.venue_areas_query(now)]
+    version, rows = await server.fetch_all(statements)
+
+    def render():
+        areas = [dict(area, venues=list(area["venues"]))
+                 for area in queries.group_areas(rows)]
+        return render_template('pages/venues.html', areas=areas)
+    return version, render
+
+
+async def artists(server, environ):
+    with app.request_context(environ):
+        args = page_args((int,))
+        statements = [queries.listing_version_query(Artist),
+                      queries.keyset_query(queries.artists_query(),
+                                           queries.ARTISTS_KEY, **args)]
+    version, rows = await server.fetch_all(statements)
+
+    def render():
+        page = queries.keyset_result(rows, queries.ARTISTS_KEY, **args)
+        data = [{"id": a.id, "name": a.name} for a in page["items"]]
+        return render_template('pages/artists.html', artists=data, page=page)
+    return version, render
+
+
+async def shows(server, environ):
+    with app.request_context(environ):
+        args = page_args((datetime, int))
+        statements = [queries.listing_version_query(Show, Venue, Artist),
+                      queries.keyset_query(queries.shows_query(),
+                                           queries.SHOWS_KEY, **args)]
+    version, rows = await server.fetch_all(statements)
+
+    def render():
+        page = queries.keyset_result(rows, queries.SHOWS_KEY, **args)
+        data = [show_row(s) for s in page["items"]]
+        return render_template('pages/shows.html', shows=data, page=page)
+    return version, render
+
+
+async def show_venue(server, environ, venue_id):
+    now = datetime.now()
+    with app.request_context(environ):
+        statements = [
+            queries.venue_version_query(venue_id, now),
+            db.select([Venue.__table__]).where(Venue.id == venue_id),
+            queries.venue_shows_query(venue_id, upcoming=False, now=now),
+            queries.venue_shows_query(venue_id, upcoming=True, now=now)]
+    version, venue, past, upcoming = await server.fetch_all(statements)
+
+    def render():
+        data = venue_data(venue[0], [_dict(s) for s in past],
+                          [_dict(s) for s in upcoming])
+        return render_template('pages/show_venue.html', venue=data)
+    return version, render
+
+
+async def show_artist(server, environ, artist_id):
+    now = datetime.now()
+    with app.request_context(environ):
+        statements = [
+            queries.artist_version_query(artist_id, now),
+            db.select([Artist.__table__]).where(Artist.id == artist_id),
+            queries.artist_shows_query(artist_id, upcoming=False, now=now),
+            queries.artist_shows_query(artist_id, upcoming=True, now=now)]
+    version, artist, past, upcoming = await server.fetch_all(statements)
+
+    def render():
+        data = artist_data(artist[0], [_dict(s) for s in past],
+                           [_dict(s) for s in upcoming])
+        return render_template('pages/show_artist.html', artist=data)
+    return version, render
+
+
+def _search_view(kind, template):
+    async def view(server, environ):
+        with app.request_context(environ):
+            term = request.values.get('search_term', '')
+            page = request.values.get('page', 1, type=int)
+            genres = request.values.getlist('genre')
+            sql = search.search_queries(kind, term, page, genres=genres)
+
+        if sql is None:
+            # in-memory index: one lookup, nothing to overlap
+            def run():
+                with app.request_context(environ):
+                    return search.search(kind, term, page=page, genres=genres)
+            results = await asyncio.get_event_loop().run_in_executor(
+                server.executor, run)
+        else:
+            total, rows, counts, page, limit, genres = sql
+            total, rows, counts = await server.fetch_all([total, rows, counts])
+            results = search.result(rows, total[0][0], page, limit, counts,
+                                    genres)
+
+        def render():
+            return render_template(template, results=results, search_term=term)
+        return None, render
+    return view
+
+
+VIEWS = {
+    'venues': (venues, ('GET',)),
+    'artists': (artists, ('GET',)),
+    'shows': (shows, ('GET',)),
+    'show_venue': (show_venue, ('GET',)),
+    'show_artist': (show_artist, ('GET',)),
+    'search_venues': (_search_view('venue', 'pages/search_venues.html'),
+                      ('GET', 'POST')),
+    'search_artists': (_search_view('artist', 'pages/search_artists.html'),
+                       ('GET', 'POST')),
+}
+
+
+#----------------------------------------------------------------------------#
+# Server.
+#----------------------------------------------------------------------------#
+
+
+def _environ(scope, body):
+    # The WSGI environ for an ASGI http scope (PEP 3333 / ASGI spec)
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def _call_wsgi(environ):
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    result = app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, headers = started
+    return int(status.split(' ', 1)[0]), headers, body
+
+
+class AsyncServer(object):
+
+    def __init__(self, flask_app):
+        config = flask_app.config
+        self.executor = ThreadPoolExecutor(config['ASYNC_THREADS'])
+        if asyncpg is not None and \
+                make_url(_read_url(config)).get_backend_name() in ('postgres', 'postgresql'):
+            self.db = AsyncpgDatabase(config)
+        else:
+            self.db = ThreadedDatabase(config, self.executor)
+        self._started = None
+
+    async def _start(self):
+        # On lifespan startup, or the first request under servers without it
+        if self._started is None:
+            self._started = asyncio.ensure_future(self.db.start())
+        await self._started
+
+    async def fetch_all(self, statements):
+        return await asyncio.gather(
+            *[self.db.fetch(_statement(s)) for s in statements])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        await self._start()
+        response = await self._dispatch(scope, body)
+        if response is None:
+            response = await asyncio.get_event_loop().run_in_executor(
+                self.executor, _call_wsgi, _environ(scope, body))
+        status, headers, content = response
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def _dispatch(self, scope, body):
+        # (status, headers, body) from an async view, or None
+        environ = _environ(scope, body)
+        with app.request_context(environ):
+            if request.endpoint not in VIEWS or request.routing_exception \
+                    or session.get('_flashes') or pinned_to_primary():
+                return None
+            view, methods = VIEWS[request.endpoint]
+            args = request.view_args
+        if scope['method'] not in methods:
+            return None
+
+        try:
+            version, render = await view(self, environ, **args)
+        except HTTPException:
+            return None
+
+        environ = _environ(scope, body)
+        with app.request_context(environ):
+            try:
+                if scope['method'] == 'GET' and version is not None:
+                    response = validated_response(queries.version_of(
+                        version[0] if version else None), render)
+                else:
+                    response = app.make_response(render())
+            except HTTPException:
+                return None
+            return (response.status_code, response.headers.to_wsgi_list(),
+                    response.get_data())
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self._start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.db.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = create_app()
+application = AsyncServer(app)
@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+#----------------------------------------------------------------------------#
+# Static asset bundles.
+#----------------------------------------------------------------------------#
+
+# `flask build-assets` concatenates and minifies each bundle below, writes it
+# to static/dist/ under a name carrying a hash of its content, next to .gz
+# and .br copies, and records the names in static/dist/manifest.json. The
+# layouts ask asset_urls() for a bundle: one hashed URL once the manifest is
+# there (and the app isn't in debug mode), the source files otherwise. A
+# hashed file never changes, so it is served with a one-year immutable
+# Cache-Control; a new build gives changed bundles new names, and old names
+# are kept so pages rendered before a deploy still load.
+#
+# Bundles live in static/dist/, at the same depth as static/css/, so the
+# relative url(../fonts/...) references in the stylesheets still resolve.
+# Font Awesome stays on its kit (kit.fontawesome.com), which serves only the
+# icons the account uses.
+
+BUNDLES = {
+    'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                 'css/main.responsive.css', 'css/main.quickfix.css'],
+    'form.css': ['css/bootstrap.min.css', 'css/bootstrap-theme.min.css',
+                 'css/layout.main.css', 'css/main.css',
+                 'css/main.responsive.css', 'css/main.quickfix.css'],
+    # in <head>: moment and parseISOString are there for inline scripts
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js',
+                'js/script.js'],
+    # deferred, end of <body>
+    'body.js': ['js/libs/jquery-1.11.1.min.js',
+                'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+    'respond.js': ['js/libs/respond-1.4.2.min.js'],
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+MAX_AGE = 365 * 24 * 3600
+
+
+def minify_css(css):
+    # Comments and whitespace only; /*! license comments are kept
+    css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    # Without rjsmin, scripts are bundled as they are: all but the two small
+    # local ones already ship minified
+    return rjsmin.jsmin(js, keep_bang_comments=True) if rjsmin else js
+
+
+def bundle(static_folder, name):
+    sources = []
+    for path in BUNDLES[name]:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as f:
+            sources.append(f.read())
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(s) for s in sources)
+    return '\n;\n'.join(minify_js(s) for s in sources)
+
+
+def _write(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build(static_folder, clean=False):
+    # Returns the new manifest: {bundle: hashed file name}
+    out = os.path.join(static_folder, DIST)
+    os.makedirs(out, exist_ok=True)
+    manifest = {}
+    for name in sorted(BUNDLES):
+        data = bundle(static_folder, name).encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        filename = '{}.{}{}'.format(
+            stem, hashlib.sha256(data).hexdigest()[:12], ext)
+        path = os.path.join(out, filename)
+        _write(path, data)
+        _write(path + '.gz', gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            _write(path + '.br', brotli.compress(data))
+        manifest[name] = filename
+
+    if clean:
+        keep = set(manifest.values())
+        for filename in os.listdir(out):
+            base = re.sub(r'\.(gz|br)$', '', filename)
+            if base not in keep and filename != MANIFEST:
+                os.remove(os.path.join(out, filename))
+    _write(os.path.join(out, MANIFEST),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+#----------------------------------------------------------------------------#
+# Serving.
+#----------------------------------------------------------------------------#
+
+
+def asset_urls(name):
+    manifest = current_app.extensions.get('assets')
+    if manifest and name in manifest and not current_app.debug:
+        return [url_for('asset', filename=manifest[name])]
+    return [url_for('static', filename=path) for path in BUNDLES[name]]
+
+
+def serve(filename):
+    # Hashed bundles: the precompressed copy the client accepts, cached for
+    # good by browsers and CDNs
+    directory = os.path.join(current_app.static_folder, DIST)
+    mimetype = mimetypes.guess_type(filename)[0]
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in request.accept_encodings and \
+                os.path.isfile(os.path.join(directory, filename + suffix)):
+            encoding, filename = candidate, filename + suffix
+            break
+    response = send_from_directory(directory, filename, mimetype=mimetype,
+                                   cache_timeout=MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = \
+        'public, max-age={}, immutable'.format(MAX_AGE)
+    return response
+
+
+def init_app(app):
+    # The manifest is read once, at startup: deploy a build, then restart
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    app.add_url_rule('/static/{}/<path:filename>'.format(DIST), 'asset', serve)
+    app.add_template_global(asset_urls)
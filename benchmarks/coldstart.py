@@ -0,0 +1,110 @@
+"""Worker cold start, with and without the template bytecode cache.
+
+    python benchmarks/coldstart.py -n 10
+
+Starts -n fresh interpreters per mode, the way a worker starts when it is
+not forked from a preloaded master (see wsgi.py). Each one imports and
+builds the app, then requests every page once (first) and again (warm);
+the difference is mostly template parsing and compiling. A second set of
+processes only loads every template, with no database involved. Modes:
+TEMPLATE_CACHE_DIR empty, and a cache filled by `flask compile-templates`.
+Reports medians in milliseconds. Uses DATABASE_URL; seed it first.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ('/', '/venues', '/artists', '/shows', '/venues/{venue_id}',
+         '/artists/{artist_id}', '/venues/{venue_id}/edit',
+         '/artists/{artist_id}/edit', '/venues/create', '/artists/create',
+         '/shows/create', '/venues/search?search_term=a',
+         '/artists/search?search_term=a', '/no-such-page')
+
+WORKER = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+built = time.perf_counter()
+result = {"import": imported - started, "create_app": built - imported}
+if sys.argv[1] == 'templates':
+    env = app.jinja_env
+    for name in env.list_templates(extensions=['html']):
+        env.get_template(name)
+    result["templates"] = time.perf_counter() - built
+else:
+    client = app.test_client()
+    for run in ('first', 'warm'):
+        t0 = time.perf_counter()
+        for path in sys.argv[2:]:
+            client.get(path).close()
+        result[run] = time.perf_counter() - t0
+print(json.dumps(result))
+'''
+
+
+def sample_paths():
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from models import db, Artist, Venue
+    with create_app({'TEMPLATE_CACHE_DIR': '', 'ERROR_LOG': ''}).app_context():
+        venue_id = db.session.query(Venue.id).order_by(Venue.id).limit(1).scalar()
+        artist_id = db.session.query(Artist.id).order_by(Artist.id).limit(1).scalar()
+    if venue_id is None or artist_id is None:
+        sys.exit('seed the database first (benchmarks/seed.py)')
+    return [p.format(venue_id=venue_id, artist_id=artist_id) for p in PATHS]
+
+
+def _run(env, *args):
+    output = subprocess.run([sys.executable, '-c', WORKER] + list(args),
+                            cwd=ROOT, env=env, check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def measure(cache_dir, paths, runs):
+    env = dict(os.environ, TEMPLATE_CACHE_DIR=cache_dir, CACHE_BACKEND='none',
+               STREAM_LISTINGS='0', ERROR_LOG='',
+               PYTHONWARNINGS='ignore::DeprecationWarning')
+    if cache_dir:
+        subprocess.run([sys.executable, '-m', 'flask', 'compile-templates',
+                        '--clear'], cwd=ROOT, env=dict(env, FLASK_APP='app'),
+                       check=True, stdout=subprocess.DEVNULL)
+    samples = [_run(env, 'requests', *paths) for _ in range(runs)] + \
+        [_run(env, 'templates') for _ in range(runs)]
+    keys = ('import', 'create_app', 'templates', 'first', 'warm')
+    return {key: statistics.median(s[key] for s in samples if key in s) * 1000
+            for key in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sample_paths()
+    cache_dir = tempfile.mkdtemp(prefix='jinja-cache-')
+    try:
+        results = [('no cache', measure('', paths, args.runs)),
+                   ('bytecode cache', measure(cache_dir, paths, args.runs))]
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print('{} runs, {} pages; medians in ms'.format(args.runs, len(paths)))
+    print('{:<15} {:>8} {:>10} {:>10} {:>12} {:>11}'.format(
+        'mode', 'import', 'create_app', 'templates', 'first pages',
+        'warm pages'))
+    for name, r in results:
+        print('{:<15} {import:>8.1f} {create_app:>10.1f} {templates:>10.1f} '
+              '{first:>12.1f} {warm:>11.1f}'.format(name, **r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Sync (WSGI) vs async (ASGI) serving under concurrent load.
+
+    python benchmarks/concurrency.py -c 200 -n 5000
+
+Starts the Flask app on a threaded WSGI server and asgi.py under uvicorn,
+one process each, both against DATABASE_URL with the response cache off,
+and drives the read routes over keep-alive connections from -c concurrent
+clients. Reports requests per second and p50/p95/p99 latency for each.
+--sync-cmd/--async-cmd swap in other servers (e.g. gunicorn); {port} is
+filled in. Seed the database first (benchmarks/seed.py).
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYNC_CMD = (sys.executable + " -c \"from werkzeug.serving import run_simple; "
+            "from wsgi import application; "
+            "run_simple('127.0.0.1', {port}, application, threaded=True)\"")
+ASYNC_CMD = sys.executable + ' -m uvicorn asgi:application --port {port} ' \
+    '--log-level warning --no-access-log'
+PATHS = ('/venues', '/artists', '/shows', '/venues/{venue_id}',
+         '/artists/{artist_id}', '/venues/search?search_term={word}',
+         '/artists/search?search_term={word}')
+
+
+def sample_paths(count, seed):
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from models import db, Artist, Venue
+    rng = random.Random(seed)
+    with create_app().app_context():
+        venue_ids = [r[0] for r in db.session.query(Venue.id).limit(5000)]
+        artist_ids = [r[0] for r in db.session.query(Artist.id).limit(5000)]
+        words = sorted({w.lower() for name, in db.session.query(Venue.name).limit(200)
+                        for w in (name or '').split() if len(w) > 2}) or ['a']
+    if not venue_ids or not artist_ids:
+        sys.exit('seed the database first (benchmarks/seed.py)')
+    return [rng.choice(PATHS).format(venue_id=rng.choice(venue_ids),
+                                     artist_id=rng.choice(artist_ids),
+                                     word=rng.choice(words))
+            for _ in range(count)]
+
+
+#  Load generator
+#  ----------------------------------------------------------------
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+    keep_alive = headers.get('connection', '').lower() != 'close' and \
+        not status_line.startswith(b'HTTP/1.0')
+    return status, keep_alive
+
+
+async def _client(port, paths, timings, errors):
+    connection = None
+    while paths:
+        path = paths.pop()
+        if connection is None:
+            connection = await asyncio.open_connection('127.0.0.1', port)
+        reader, writer = connection
+        started = time.perf_counter()
+        try:
+            writer.write('GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'
+                         .format(path).encode('latin-1'))
+            status, keep_alive = await _read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors.append(path)
+            writer.close()
+            connection = None
+            continue
+        timings.append(time.perf_counter() - started)
+        if status >= 500:
+            errors.append(path)
+        if not keep_alive:
+            writer.close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def _load(port, paths, concurrency):
+    timings, errors = [], []
+    paths = list(reversed(paths))
+    started = time.perf_counter()
+    await asyncio.gather(*[_client(port, paths, timings, errors)
+                           for _ in range(concurrency)])
+    return timings, errors, time.perf_counter() - started
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit('server on port {} did not start'.format(port))
+
+
+def run(name, command, port, paths, concurrency, warmup):
+    env = dict(os.environ, CACHE_BACKEND='none', STREAM_LISTINGS='0')
+    server = subprocess.Popen(command.format(port=port), shell=True, cwd=ROOT,
+                              env=env)
+    try:
+        _wait_for(port)
+        asyncio.run(_load(port, paths[:warmup], concurrency))
+        timings, errors, elapsed = asyncio.run(_load(port, paths, concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+    timings.sort()
+    return {
+        "name": name,
+        "rps": len(timings) / elapsed if elapsed else 0.0,
+        "p50": _percentile(timings, 0.50) * 1000,
+        "p95": _percentile(timings, 0.95) * 1000,
+        "p99": _percentile(timings, 0.99) * 1000,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--concurrency', type=int, default=100)
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sync-cmd', default=SYNC_CMD)
+    parser.add_argument('--async-cmd', default=ASYNC_CMD)
+    parser.add_argument('--port', type=int, default=8701)
+    args = parser.parse_args()
+
+    paths = sample_paths(args.requests, args.seed)
+    results = [
+        run('sync (wsgi)', args.sync_cmd, args.port, paths,
+            args.concurrency, args.warmup),
+        run('async (asgi)', args.async_cmd, args.port + 1, paths,
+            args.concurrency, args.warmup),
+    ]
+
+    print('{} requests, {} concurrent clients'.format(
+        args.requests, args.concurrency))
+    print('{:<14} {:>9} {:>9} {:>9} {:>9} {:>7}'.format(
+        'server', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for r in results:
+        print('{name:<14} {rps:>9.1f} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f} '
+              '{errors:>7}'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
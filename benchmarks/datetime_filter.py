@@ -0,0 +1,73 @@
+"""Micro-benchmark: the `datetime` Jinja filter, old vs. current.
+
+    python benchmarks/datetime_filter.py [--shows 1000] [--repeat 20]
+
+Formats the start times of a synthetic page of shows the way shows.html
+does, once with the original str() -> dateutil -> babel round trip and
+once with app.format_datetime on native datetimes.
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import format_datetime, _format_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # Shows cluster on a few hundred distinct start times, like real listings
+    start = datetime(2021, 1, 23, 20, 0)
+    times = [start + timedelta(days=i % 300, hours=i % 4)
+             for i in range(args.shows)]
+    strings = [str(t) for t in times]
+
+    assert [legacy_format_datetime(s, 'full') for s in strings[:50]] == \
+        [format_datetime(t, 'full') for t in times[:50]]
+
+    def legacy():
+        for s in strings:
+            legacy_format_datetime(s, 'full')
+
+    def current():
+        for t in times:
+            format_datetime(t, 'full')
+
+    def current_cold():
+        _format_datetime.cache_clear()
+        current()
+
+    results = [
+        ('legacy (str + dateutil + babel)', legacy),
+        ('current, memo cold', current_cold),
+        ('current, memo warm', current),
+    ]
+    current()
+    baseline = None
+    for name, fn in results:
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print('{:<34} {:9.2f} ms/page  {:6.1f}x'.format(
+            name, best * 1000, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
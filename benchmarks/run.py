@@ -0,0 +1,279 @@
+"""In-process benchmark of every route, through the WSGI test client.
+
+    python benchmarks/run.py -n 200 --save baseline.json
+    python benchmarks/run.py -n 200 --compare baseline.json --threshold 0.2
+
+Runs against the database in DATABASE_URL (see benchmarks/seed.py) with
+the response cache off, so every request does its real work. For each
+route it reports p50/p95/p99 latency, requests per second and SQL
+statements per request. With --compare, a route whose p95 grew by more
+than --threshold (or that runs more queries than the baseline) is flagged
+and the exit status is 1.
+
+Form submissions insert and update rows; --read-only skips them.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import warnings
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app  # noqa: E402
+from instrumentation import QueryRecorder  # noqa: E402
+from models import db, Artist, Genre, Venue  # noqa: E402
+
+# Not benchmarked: deleting would eat the sample data, the rest is internal
+SKIP_ENDPOINTS = ('static', 'asset', 'thumbnail', 'delete_venue', 'pool_stats',
+                  'cache_stats')
+
+
+def _sample(model, n, rng):
+    ids = [r[0] for r in db.session.query(model.id).order_by(model.id).limit(10000)]
+    if not ids:
+        sys.exit('no {} rows: seed the database first (benchmarks/seed.py)'.format(
+            model.__tablename__))
+    return rng.sample(ids, min(n, len(ids)))
+
+
+def _terms(model):
+    names = [r[0] for r in db.session.query(model.name).limit(500)]
+    words = {w for name in names for w in name.split() if len(w) > 2}
+    return sorted(words) or ['a']
+
+
+def scenarios(rng):
+    """(name, endpoint, request factory) for each benchmarked request.
+
+    A factory returns the keyword arguments for `client.open`, drawing a
+    fresh id or term each call so the run isn't one hot row.
+    """
+    venue_ids = _sample(Venue, 200, rng)
+    artist_ids = _sample(Artist, 200, rng)
+    venue_terms = _terms(Venue)
+    artist_terms = _terms(Artist)
+    venue = Venue.query.get(venue_ids[0])
+    points = db.session.query(Venue.latitude, Venue.longitude).filter(
+        Venue.geocell.isnot(None)).limit(200).all() or [(40.7128, -74.0060)]
+    genres = [r[0] for r in db.session.query(Genre.name)] or ['Jazz']
+    counter = itertools.count()
+
+    def get(path):
+        return lambda: {"path": path() if callable(path) else path}
+
+    def post(path, data):
+        return lambda: {"path": path() if callable(path) else path,
+                        "method": 'POST', "data": data()}
+
+    vid = lambda: rng.choice(venue_ids)  # noqa: E731
+    aid = lambda: rng.choice(artist_ids)  # noqa: E731
+
+    def near():
+        lat, lng = rng.choice(points)
+        return '/api/v1/venues/near?lat={:.4f}&lng={:.4f}&radius_km=25'.format(
+            lat, lng)
+
+    def box():
+        lat, lng = rng.choice(points)
+        return '/api/v1/venues/near?bbox={:.4f},{:.4f},{:.4f},{:.4f}'.format(
+            lng - 0.2, lat - 0.2, lng + 0.2, lat + 0.2)
+
+    def genre_search(kind):
+        return '/api/v1/{}/search?q={}&genre={}'.format(
+            kind, rng.choice(venue_terms if kind == 'venues' else artist_terms),
+            quote(rng.choice(genres)))
+
+    def venue_form():
+        n = next(counter)
+        return {"name": 'Bench Venue {}'.format(n), "city": venue.city,
+                "state": venue.state, "address": '{} Bench St'.format(n),
+                "phone": '415-555-0100', "genres": 'Jazz',
+                "facebook_link": '', "website": '', "seeking_talent": 'No',
+                "seeking_description": ''}
+
+    def artist_form():
+        n = next(counter)
+        return {"name": 'Bench Artist {}'.format(n), "city": venue.city,
+                "state": venue.state, "phone": '415-555-0101', "genres": 'Jazz',
+                "facebook_link": '', "website": '', "seeking_venue": 'No',
+                "seeking_description": ''}
+
+    def show_form():
+        return {"venue_id": str(vid()), "artist_id": str(aid()),
+                "start_time": '2030-01-01 20:00:00'}
+
+    reads = [
+        ('home', 'index', get('/')),
+        ('venues', 'venues', get('/venues')),
+        ('venue detail', 'show_venue', get(lambda: '/venues/{}'.format(vid()))),
+        ('venue search', 'search_venues', post(
+            '/venues/search', lambda: {"search_term": rng.choice(venue_terms)})),
+        ('venue genre search', 'search_venues', get(
+            lambda: '/venues/search?genre={}'.format(quote(rng.choice(genres))))),
+        ('artists', 'artists', get('/artists')),
+        ('artist detail', 'show_artist', get(lambda: '/artists/{}'.format(aid()))),
+        ('artist search', 'search_artists', post(
+            '/artists/search', lambda: {"search_term": rng.choice(artist_terms)})),
+        ('shows', 'shows', get('/shows')),
+        ('venue form', 'create_venue_form', get('/venues/create')),
+        ('artist form', 'create_artist_form', get('/artists/create')),
+        ('show form', 'create_shows', get('/shows/create')),
+        ('venue edit form', 'edit_venue', get(lambda: '/venues/{}/edit'.format(vid()))),
+        ('artist edit form', 'edit_artist', get(lambda: '/artists/{}/edit'.format(aid()))),
+        ('api venues', 'api.venues', get('/api/v1/venues')),
+        ('api venue', 'api.venue', get(lambda: '/api/v1/venues/{}'.format(vid()))),
+        ('api venues near', 'api.venues_near', get(near)),
+        ('api venues in box', 'api.venues_near', get(box)),
+        ('api venue search', 'api.search_venues', get(
+            lambda: '/api/v1/venues/search?q={}'.format(rng.choice(venue_terms)))),
+        ('api venue genre search', 'api.search_venues', get(
+            lambda: genre_search('venues'))),
+        ('api artists', 'api.artists', get('/api/v1/artists')),
+        ('api artist', 'api.artist', get(lambda: '/api/v1/artists/{}'.format(aid()))),
+        ('api artist search', 'api.search_artists', get(
+            lambda: '/api/v1/artists/search?q={}'.format(rng.choice(artist_terms)))),
+        ('api artist genre search', 'api.search_artists', get(
+            lambda: genre_search('artists'))),
+        ('api shows', 'api.shows', get('/api/v1/shows')),
+        ('api venue shows', 'api.shows', get(
+            lambda: '/api/v1/shows?venue_id={}'.format(vid()))),
+        ('api show', 'api.show', get('/api/v1/shows/1')),
+    ]
+    writes = [
+        ('create venue', 'create_venue_submission', post('/venues/create', venue_form)),
+        ('create artist', 'create_artist_submission', post('/artists/create', artist_form)),
+        ('create show', 'create_show_submission', post('/shows/create', show_form)),
+        ('edit venue', 'edit_venue_submission', post(
+            lambda: '/venues/{}/edit'.format(vid()), venue_form)),
+        ('edit artist', 'edit_artist_submission', post(
+            lambda: '/artists/{}/edit'.format(aid()), artist_form)),
+        ('api show batch', 'api.create_shows_batch', lambda: {
+            "path": '/api/v1/shows/batch', "method": 'POST',
+            "json": {"shows": [show_form() for _ in range(20)]}}),
+    ]
+    return reads, writes
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def measure(client, make_request, iterations, warmup):
+    for _ in range(warmup):
+        client.open(**make_request()).close()
+
+    timings, queries, errors = [], 0, 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        kwargs = make_request()
+        with QueryRecorder() as recorder:
+            t0 = time.perf_counter()
+            response = client.open(**kwargs)
+            response.get_data()
+            timings.append(time.perf_counter() - t0)
+        if response.status_code >= 500:
+            errors += 1
+        response.close()
+        queries += recorder.count
+    total = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        "p50_ms": round(_percentile(timings, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(timings, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 0.99) * 1000, 3),
+        "rps": round(iterations / total, 1) if total else 0.0,
+        "queries": round(queries / iterations, 2),
+        "errors": errors,
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append('{}: p95 {:.2f}ms -> {:.2f}ms'.format(
+                name, before["p95_ms"], now["p95_ms"]))
+        if now["queries"] > before["queries"]:
+            regressions.append('{}: queries/request {} -> {}'.format(
+                name, before["queries"], now["queries"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', action='append', default=[],
+                        help='run only routes whose name contains this')
+    parser.add_argument('--read-only', action='store_true')
+    parser.add_argument('--cache', action='store_true',
+                        help='leave the response cache on')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed p95 slowdown against the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    # flask_wtf.Form warns on every form instance
+    warnings.simplefilter('ignore', DeprecationWarning)
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    if not args.cache:
+        app.extensions['response_cache'] = None
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        reads, writes = scenarios(rng)
+    runs = reads if args.read_only else reads + writes
+
+    covered = {endpoint for _, endpoint, _ in reads + writes}
+    missing = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                     if rule.endpoint not in covered
+                     and rule.endpoint not in SKIP_ENDPOINTS)
+    if missing:
+        print('warning: no benchmark for {}'.format(', '.join(missing)))
+
+    if args.only:
+        runs = [r for r in runs if any(o in r[0] for o in args.only)]
+
+    client = app.test_client()
+    results = {}
+    print('{:<20} {:>9} {:>9} {:>9} {:>8} {:>8}'.format(
+        'route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries'))
+    for name, _, make_request in runs:
+        r = results[name] = measure(client, make_request, args.iterations, args.warmup)
+        print('{:<20} {:>9.2f} {:>9.2f} {:>9.2f} {:>8.1f} {:>8.2f}{}'.format(
+            name, r["p50_ms"], r["p95_ms"], r["p99_ms"], r["rps"], r["queries"],
+            '  ({} errors)'.format(r["errors"]) if r["errors"] else ''))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({"iterations": args.iterations, "results": results},
+                      f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against {}'.format(args.compare))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Seed the configured database with synthetic venues, artists and shows.
+
+    python benchmarks/seed.py --venues 100000 --artists 100000 --shows 2000000
+
+Uses DATABASE_URL like the app. Cities are drawn with a heavy skew towards
+big metros, show times cluster on evenings and weekends and spread over
+the last two years and the next one, so past/upcoming splits, area
+grouping and search selectivity look like production rather than a
+uniform grid. Runs are reproducible for a given --seed.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app  # noqa: E402
+import areas  # noqa: E402
+import counters  # noqa: E402
+import facets  # noqa: E402
+import geo  # noqa: E402
+from forms import VenueForm  # noqa: E402
+from importer import allocate_ids  # noqa: E402
+from models import db, Artist, Venue, Show  # noqa: E402
+
+# (city, state, relative weight ~ metro population)
+CITIES = [
+    ('New York', 'NY', 190), ('Los Angeles', 'CA', 130), ('Chicago', 'IL', 95),
+    ('Dallas', 'TX', 75), ('Houston', 'TX', 71), ('Washington', 'DC', 63),
+    ('Miami', 'FL', 61), ('Philadelphia', 'PA', 61), ('Atlanta', 'GA', 60),
+    ('Phoenix', 'AZ', 49), ('Boston', 'MA', 49), ('San Francisco', 'CA', 47),
+    ('Detroit', 'MI', 43), ('Seattle', 'WA', 40), ('Minneapolis', 'MN', 37),
+    ('San Diego', 'CA', 33), ('Tampa', 'FL', 32), ('Denver', 'CO', 30),
+    ('Baltimore', 'MD', 28), ('St. Louis', 'MO', 28), ('Orlando', 'FL', 27),
+    ('Charlotte', 'NC', 27), ('Portland', 'OR', 25), ('Austin', 'TX', 23),
+    ('Pittsburgh', 'PA', 23), ('Las Vegas', 'NV', 23), ('Cincinnati', 'OH', 22),
+    ('Kansas City', 'MO', 22), ('Columbus', 'OH', 21), ('Nashville', 'TN', 20),
+    ('Cleveland', 'OH', 20), ('Indianapolis', 'IN', 21), ('New Orleans', 'LA', 12),
+    ('Salt Lake City', 'UT', 12), ('Raleigh', 'NC', 14), ('Memphis', 'TN', 13),
+    ('Richmond', 'VA', 13), ('Louisville', 'KY', 13), ('Oklahoma City', 'OK', 14),
+    ('Albuquerque', 'NM', 9), ('Tucson', 'AZ', 10), ('Omaha', 'NE', 9),
+    ('Boise', 'ID', 7), ('Burlington', 'VT', 2), ('Missoula', 'MT', 1),
+]
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+WORDS = ('Blue', 'Red', 'Velvet', 'Golden', 'Electric', 'Silver', 'Midnight',
+         'Neon', 'Crystal', 'Lucky', 'Wild', 'Iron', 'Hollow', 'Paper', 'Echo')
+VENUE_KINDS = ('Hall', 'Lounge', 'Room', 'Club', 'Theatre', 'Bar', 'Garden')
+ARTIST_KINDS = ('Band', 'Quartet', 'Collective', 'Trio', 'Orchestra', 'Duo')
+
+
+def _name(rng, kinds, i):
+    return '{} {} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS),
+                                rng.choice(kinds), i)
+
+
+def _start_time(rng, now):
+    # two years back to one year ahead, evenings, weekend-heavy
+    day = now + timedelta(days=rng.randint(-730, 365))
+    while day.weekday() < 4 and rng.random() < 0.5:
+        day += timedelta(days=1)
+    return day.replace(hour=rng.choice((19, 20, 20, 21, 21, 22)),
+                       minute=rng.choice((0, 0, 30)), second=0, microsecond=0)
+
+
+def _insert(table, rows_for_ids, count, batch):
+    connection = db.session.connection()
+    all_ids = []
+    for offset in range(0, count, batch):
+        n = min(batch, count - offset)
+        ids = allocate_ids(connection, table, n)
+        connection.execute(table.insert(), rows_for_ids(ids))
+        db.session.commit()
+        connection = db.session.connection()
+        all_ids.extend(ids)
+        print('  {}: {}/{}'.format(table.name, offset + n, count), end='\r')
+    print()
+    return all_ids
+
+
+def seed(venues, artists, shows, batch=10000, random_seed=0):
+    rng = random.Random(random_seed)
+    now, stamp = datetime.now(), datetime.utcnow()
+    cities = [(c, s) for c, s, _ in CITIES]
+    weights = [w for _, _, w in CITIES]
+
+    def venue_rows(ids):
+        rows = []
+        for i in ids:
+            city, state = rng.choices(cities, weights)[0]
+            # scattered over the metro area, ~10km around the centre
+            centre = geo.position(city, state)
+            rows.append(dict(
+                id=i, name=_name(rng, VENUE_KINDS, i), city=city, state=state,
+                address='{} {} St'.format(rng.randint(1, 9999), rng.choice(WORDS)),
+                phone='{}-555-{:04d}'.format(rng.randint(200, 999), i % 10000),
+                genres=rng.sample(GENRES, rng.randint(1, 3)),
+                seeking_talent=rng.random() < 0.3, updated_at=stamp,
+                **geo.position(city, state, rng.gauss(centre["latitude"], 0.09),
+                               rng.gauss(centre["longitude"], 0.12))))
+        return rows
+
+    def artist_rows(ids):
+        rows = []
+        for i in ids:
+            city, state = rng.choices(cities, weights)[0]
+            rows.append(dict(
+                id=i, name=_name(rng, ARTIST_KINDS, i), city=city, state=state,
+                genres=','.join(rng.sample(GENRES, rng.randint(1, 2))),
+                seeking_venue=rng.random() < 0.4,
+                updated_at=stamp))
+        return rows
+
+    started = time.time()
+    venue_ids = _insert(Venue.__table__, venue_rows, venues, batch)
+    artist_ids = _insert(Artist.__table__, artist_rows, artists, batch)
+
+    # A few venues and artists get most of the shows
+    def show_rows(ids):
+        rows = [dict(id=i,
+                     venue_id=venue_ids[min(int(rng.paretovariate(1.2)) - 1,
+                                            len(venue_ids) - 1) * 7919 % len(venue_ids)],
+                     artist_id=artist_ids[min(int(rng.paretovariate(1.2)) - 1,
+                                              len(artist_ids) - 1) * 104729 % len(artist_ids)],
+                     start_time=_start_time(rng, now), updated_at=stamp)
+                for i in ids]
+        for row in rows:
+            row["counted_past"] = counters.is_past(row["start_time"], now)
+        return rows
+
+    if venue_ids and artist_ids:
+        _insert(Show.__table__, show_rows, shows, batch)
+    for model, key in counters.TARGETS:
+        counters.fix(model, key)
+    areas.rebuild(now)
+    for model in (Venue, Artist):
+        facets.rebuild(model)
+    db.session.commit()
+    print('seeded in {:.1f}s'.format(time.time() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--create', action='store_true',
+                        help='create the tables first (empty database)')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        if args.create:
+            db.create_all()
+        seed(args.venues, args.artists, args.shows, args.batch, args.seed)
+
+
+if __name__ == '__main__':
+    main()
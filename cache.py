@@ -0,0 +1,266 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request, session, Response, jsonify, abort
+
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+# A backend stores bytes under string keys (get/set with a ttl) and keeps
+# integer counters (incr). Counters are never evicted: they hold the
+# generation of each cached path, see ResponseCache.
+
+
+class LRUBackend(object):
+    # In-process, bounded to `max_entries` cached pages
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class SharedBackend(object):
+    # Shared between workers through a redis-style client (get/set/incr)
+
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class LocalClient(object):
+    # Stand-in for a redis client when no shared cache server is available
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data.get(key, (0, None))[0] or 0) + 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+
+#----------------------------------------------------------------------------#
+# Response cache.
+#----------------------------------------------------------------------------#
+
+
+class ResponseCache(object):
+    """Caches rendered GET pages, keyed on path + query string.
+
+    Each path has a generation counter that is part of the cache key, so
+    `invalidate('/shows')` drops every variant of /shows (all pages and
+    cursors) with a single counter increment.
+
+    Under @conditional the page's ETag is part of the key too, so a page is
+    never served under a validator it wasn't rendered for: not when a show
+    starts (no write, no invalidate), nor between a write's commit and its
+    invalidate().
+    """
+
+    def __init__(self, app=None):
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'lru')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_TTL', 300)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+        app.config.setdefault('EXPOSE_INTERNAL_STATS', False)
+
+        kind = app.config['CACHE_BACKEND']
+        if kind == 'lru':
+            backend = LRUBackend(app.config['CACHE_MAX_ENTRIES'])
+        elif kind == 'shared':
+            if app.config['CACHE_REDIS_URL']:
+                import redis
+                client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            else:
+                client = LocalClient()
+            backend = SharedBackend(client)
+        elif kind == 'none':
+            backend = None
+        else:
+            raise ValueError('unknown CACHE_BACKEND: {}'.format(kind))
+        app.extensions['response_cache'] = backend
+
+        # unauthenticated, like /internal/pool
+        if app.debug or app.config['EXPOSE_INTERNAL_STATS']:
+            app.add_url_rule('/internal/cache', 'cache_stats', self.stats_view)
+
+    @property
+    def backend(self):
+        return current_app.extensions.get('response_cache')
+
+    def _key(self, path, query_string):
+        generation = self.backend.counter('gen:' + path)
+        return 'page:{}:{}:{}:{}'.format(
+            path, generation, g.get('etag', ''),
+            query_string.decode('latin-1'))
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages that show flashed messages are per-user, never cache them
+            if self.backend is None or request.method != 'GET' \
+                    or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            key = self._key(request.path, request.query_string)
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.hits += 1
+                mimetype, _, body = entry.partition(b'\n')
+                response = Response(body, mimetype=mimetype.decode())
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            self.misses += 1
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                self.backend.set(
+                    key,
+                    response.mimetype.encode() + b'\n' + response.get_data(),
+                    current_app.config['CACHE_TTL'])
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+
+    def invalidate(self, *paths):
+        if self.backend is None:
+            return
+        for path in set(paths):
+            self.backend.incr('gen:' + path)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": current_app.config['CACHE_BACKEND'],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+        }
+
+    def stats_view(self):
+        return jsonify(self.stats())
+
+
+response_cache = ResponseCache()
+
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+
+def validated_response(current, render):
+    """304 if the request's validators match `current` (values,
+    last_modified), else `render()`'s response; either way carrying the
+    ETag/Last-Modified for `current`. 404 when `current` is None."""
+    if current is None:
+        abort(404)
+    values, last_modified = current
+    etag = hashlib.sha1(repr(values).encode()).hexdigest()[:20]
+    # for ResponseCache's key
+    g.etag = etag
+
+    # If-None-Match wins over If-Modified-Since (RFC 7232 3.3)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        not_modified = last_modified.replace(microsecond=0) <= \
+            request.if_modified_since.replace(tzinfo=None)
+    else:
+        not_modified = False
+
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = current_app.make_response(render())
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # Stored copies must be revalidated, which is now cheap
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional(version):
+    """Answer 304 Not Modified before running the view when possible.
+
+    `version` gets the view arguments and returns `(values, last_modified)`
+    (see queries.venue_version) or None when the page doesn't exist. The
+    ETag is a digest of `values`, so checking it costs one small query
+    instead of the page's own queries and rendering.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+            return validated_response(version(*args, **kwargs),
+                                      lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
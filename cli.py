@@ -0,0 +1,235 @@
+import re
+import sys
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Artist, Show, Venue
+import counters
+import queries
+import search
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+def _hot_queries(now):
+    # The queries the pages run, built by the same functions: the listings
+    # and their validators, the detail pages (one query, or the per-side
+    # ones asgi.py runs) and their validators, search on Postgres (SQLite
+    # searches an in-memory index) and the counter rollover
+    hot = {
+        'venues': queries.venue_areas_query(now),
+        'venues_version': queries.listing_version_query(Venue, Show, now=now),
+        'artists_version': queries.listing_version_query(Artist, now=now),
+        'shows': queries.keyset_query(queries.shows_query(),
+                                      queries.SHOWS_KEY),
+        'shows_version': queries.listing_version_query(Show, Venue, Artist,
+                                                       now=now),
+        'show_venue': queries.venue_with_shows_query(1),
+        'show_venue_upcoming': queries.venue_shows_query(1, True, now),
+        'show_venue_past': queries.venue_shows_query(1, False, now),
+        'venue_version': queries.venue_version_query(1, now),
+        'show_artist': queries.artist_with_shows_query(1),
+        'show_artist_upcoming': queries.artist_shows_query(1, True, now),
+        'show_artist_past': queries.artist_shows_query(1, False, now),
+        'artist_version': queries.artist_version_query(1, now),
+        'rollover': counters.pending(now, 1000),
+    }
+    for kind in ('venue', 'artist'):
+        found = search.search_queries(kind, 'blue')
+        if found is not None:
+            # the page of results
+            hot['search_{}s'.format(kind)] = found[1]
+    return hot
+
+
+# Hot queries that must read a given index, not merely avoid a full scan
+# of Show
+EXPECTED_INDEXES = {
+    'rollover': 'ix_Show_rollover',
+    'search_venues': 'ix_Venue_search_trgm',
+    'search_artists': 'ix_Artist_search_trgm',
+}
+
+
+def _explain(connection, query):
+    dialect = connection.dialect
+    compiled = query.statement.compile(dialect=dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[k] for k in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    if dialect.name == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(prefix + str(compiled), params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _is_full_scan(line, table):
+    if '"{}"'.format(table) in line and 'Seq Scan' in line:
+        return True
+    # SQLite: "SCAN Show" / "SCAN TABLE Show" without an index, or the
+    # same of an alias ORM joins give it, "SCAN Show_1"
+    words = line.replace('TABLE ', '').split()
+    return len(words) > 1 and words[0] == 'SCAN' and \
+        re.match(r'{}(_\d+)?$'.format(re.escape(table)), words[1]) is not None \
+        and 'INDEX' not in line
+
+
+@click.command('check-indexes')
+@with_appcontext
+def check_indexes():
+    """EXPLAIN the pages' hot queries and fail on a full scan of Show, or
+    when the rollover or search doesn't read its index."""
+    failed = []
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Small dev tables make a seq scan look cheaper than any index,
+            # so ask the planner whether an index path exists at all
+            connection.execute('SET enable_seqscan = off')
+
+        for name, query in _hot_queries(datetime.now()).items():
+            plan = _explain(connection, query)
+            index = EXPECTED_INDEXES.get(name)
+            if any(_is_full_scan(l, Show.__tablename__) for l in plan):
+                problem = 'FULL SCAN'
+            elif index and not any(index in l for l in plan):
+                problem = 'NOT USING ' + index
+            else:
+                problem = None
+            click.echo('{}: {}'.format(name, problem or 'ok'))
+            for line in plan:
+                click.echo('    ' + line)
+            if problem:
+                failed.append('{} ({})'.format(name, problem))
+
+    if failed:
+        click.echo('Bad plans: ' + ', '.join(failed), err=True)
+        sys.exit(1)
+
+
+@click.command('import')
+@click.option('--venues', multiple=True, type=click.Path(exists=True),
+              help='CSV or JSONL file of venues (repeatable).')
+@click.option('--artists', multiple=True, type=click.Path(exists=True),
+              help='CSV or JSONL file of artists (repeatable).')
+@click.option('--shows', multiple=True, type=click.Path(exists=True),
+              help='CSV or JSONL file of shows, referencing source ids.')
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--state', 'state_name', default='import', show_default=True,
+              help='Name the progress is saved under in the database; '
+                   'rerun with the same one to resume.')
+@with_appcontext
+def import_data(venues, artists, shows, batch_size, state_name):
+    """Bulk-load venues, artists and shows from CSV/JSONL files."""
+    from importer import Importer
+    Importer(state_name, batch_size, echo=click.echo).run(
+        venues=venues, artists=artists, shows=shows)
+
+
+@click.command('refresh-areas')
+@click.option('--full', is_flag=True,
+              help='Rebuild every row instead of only rolled-over ones.')
+@with_appcontext
+def refresh_areas(full):
+    """Bring the /venues area summary up to date."""
+    import areas
+    if full:
+        areas.rebuild()
+        click.echo('rebuilt area summary')
+    else:
+        click.echo('refreshed {} rolled-over venues'.format(
+            areas.refresh_rolled_over()))
+    db.session.commit()
+
+
+@click.command('refresh-genres')
+@with_appcontext
+def refresh_genres():
+    """Rebuild the venue/artist genre links from their genres columns."""
+    import facets
+    from models import Artist, Venue
+    for model in (Venue, Artist):
+        facets.rebuild(model)
+    db.session.commit()
+    click.echo('rebuilt genre links')
+
+
+@click.command('rollover-shows')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--every', type=int, metavar='SECONDS',
+              help='Keep running, rolling over every SECONDS.')
+@with_appcontext
+def rollover_shows(batch_size, every):
+    """Move started shows from the upcoming to the past counters."""
+    if every:
+        counters.run_every(every, batch_size, echo=click.echo)
+    else:
+        click.echo('rolled over {} shows'.format(
+            counters.rollover(batch_size=batch_size)))
+
+
+@click.command('check-counters')
+@click.option('--fix', is_flag=True, help='Recount the rows that disagree.')
+@click.option('--rebuild', is_flag=True, help='Recount every row.')
+@with_appcontext
+def check_counters(fix, rebuild):
+    """Compare the show counters on Venue and Artist with the Show table."""
+    bad = 0
+    for model, key in counters.TARGETS:
+        if rebuild:
+            counters.fix(model, key)
+            click.echo('{}: recounted'.format(model.__tablename__))
+            continue
+        rows = counters.check(model, key)
+        bad += len(rows)
+        for id, upcoming, past, actual_upcoming, actual_past in rows[:20]:
+            click.echo('{} {}: upcoming {} (actual {}), past {} (actual {})'
+                       .format(model.__tablename__, id, upcoming,
+                               actual_upcoming, past, actual_past))
+        click.echo('{}: {} rows disagree'.format(model.__tablename__, len(rows)))
+        if rows and fix:
+            counters.fix(model, key, [r[0] for r in rows])
+            click.echo('{}: fixed'.format(model.__tablename__))
+    if bad and not fix:
+        sys.exit(1)
+
+
+@click.command('compile-templates')
+@click.option('--clear', is_flag=True, help='Empty the cache first.')
+@with_appcontext
+def compile_templates(clear):
+    """Compile every template into the bytecode cache (TEMPLATE_CACHE_DIR)."""
+    env = current_app.jinja_env
+    if env.bytecode_cache is None:
+        raise click.ClickException('TEMPLATE_CACHE_DIR is not set')
+    if clear:
+        env.bytecode_cache.clear()
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    click.echo('compiled {} templates into {}'.format(
+        len(names), current_app.config['TEMPLATE_CACHE_DIR']))
+
+
+@click.command('build-assets')
+@click.option('--clean', is_flag=True,
+              help='Delete bundles the new manifest no longer names.')
+@with_appcontext
+def build_assets(clean):
+    """Bundle, minify, hash and precompress the static assets."""
+    import assets
+    manifest = assets.build(current_app.static_folder, clean=clean)
+    for name, filename in sorted(manifest.items()):
+        click.echo('{} -> {}/{}'.format(name, assets.DIST, filename))
@@ -0,0 +1,175 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import bindparam, case, func, or_
+from models import db, Artist, Venue, Show
+import areas
+
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count and past_shows_count, so
+# listings and search read them instead of counting Show rows against the
+# clock. Show.counted_past says which of the two counters a show is in: it
+# is set when the show is written, and rollover() moves shows whose start
+# time has passed from upcoming to past in batches, reading the partial
+# ix_Show_rollover index (start_time, id WHERE NOT counted_past). Run it
+# every minute or so from cron (`flask rollover-shows`) or as a worker
+# (`flask rollover-shows --every 60`). check() compares the counters with
+# the Show table and fix() recounts them.
+
+TARGETS = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+
+def is_past(start_time, now=None):
+    # Shows without a start time are listed as past (queries.split_shows)
+    return start_time is None or start_time <= (now or datetime.now())
+
+
+def _update(executor, model, deltas):
+    # deltas: {id: [upcoming change, past change]}, one executemany
+    if not deltas:
+        return
+    table = model.__table__
+    executor.execute(
+        table.update().where(table.c.id == bindparam('_id')).values(
+            upcoming_shows_count=table.c.upcoming_shows_count +
+            bindparam('_upcoming'),
+            past_shows_count=table.c.past_shows_count + bindparam('_past')),
+        [{"_id": id, "_upcoming": d[0], "_past": d[1]}
+         for id, d in sorted(deltas.items())])
+
+
+def _apply(executor, rows, sign):
+    # rows: mappings with venue_id, artist_id and counted_past
+    for model, key in TARGETS:
+        deltas = defaultdict(lambda: [0, 0])
+        for row in rows:
+            if row[key] is not None:
+                deltas[row[key]][1 if row["counted_past"] else 0] += sign
+        _update(executor, model, deltas)
+
+
+def add_shows(rows, now=None, executor=None):
+    """Count new shows; call with the rows before inserting them.
+
+    Sets each row's counted_past, so the insert stores the same state the
+    counters were updated with.
+    """
+    now = now or datetime.now()
+    for row in rows:
+        row["counted_past"] = is_past(row["start_time"], now)
+    _apply(executor or db.session, rows, 1)
+
+
+def remove_shows(rows, executor=None):
+    # rows: the deleted shows' venue_id, artist_id and counted_past
+    _apply(executor or db.session, rows, -1)
+
+
+#  Rollover
+#  ----------------------------------------------------------------
+
+
+# ix_Show_rollover's WHERE, word for word: SQLite renders ~Show.counted_past
+# as "counted_past = 0", which its planner doesn't match to the index
+NOT_COUNTED_PAST = db.text('NOT "Show".counted_past')
+
+
+def pending(now, limit):
+    query = db.session.query(Show.id, Show.venue_id, Show.artist_id)\
+        .filter(NOT_COUNTED_PAST, Show.start_time <= now)\
+        .order_by(Show.start_time, Show.id).limit(limit)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # concurrent runs take different batches instead of waiting
+        query = query.with_for_update(skip_locked=True)
+    return query
+
+
+def rollover(now=None, batch_size=1000, echo=None):
+    """Move started shows from the upcoming to the past counters.
+
+    Commits after each batch, so a long backlog doesn't hold locks and an
+    interrupted run loses nothing.
+    """
+    now = now or datetime.now()
+    moved = 0
+    while True:
+        batch = pending(now, batch_size).all()
+        if not batch:
+            return moved
+        ids = [s.id for s in batch]
+        db.session.execute(Show.__table__.update()
+                           .where(Show.id.in_(ids))
+                           .values(counted_past=True))
+        for model, key in TARGETS:
+            deltas = defaultdict(lambda: [0, 0])
+            for s in batch:
+                if getattr(s, key) is not None:
+                    deltas[getattr(s, key)][0] -= 1
+                    deltas[getattr(s, key)][1] += 1
+            _update(db.session, model, deltas)
+        areas.refresh([s.venue_id for s in batch], now)
+        db.session.commit()
+        moved += len(batch)
+        if echo:
+            echo('rolled over {} shows'.format(moved))
+
+
+def run_every(seconds, batch_size=1000, echo=print):
+    while True:
+        started = time.time()
+        moved = rollover(batch_size=batch_size)
+        if moved:
+            echo('rolled over {} shows'.format(moved))
+        time.sleep(max(0, seconds - (time.time() - started)))
+
+
+#  Consistency
+#  ----------------------------------------------------------------
+
+
+def _actual_counts(key):
+    fk = getattr(Show, key)
+    return db.session.query(
+        fk.label('id'),
+        func.sum(case([(Show.counted_past, 0)], else_=1)).label('upcoming'),
+        func.sum(case([(Show.counted_past, 1)], else_=0)).label('past'))\
+        .filter(fk.isnot(None)).group_by(fk).subquery()
+
+
+def check(model, key):
+    """(id, stored upcoming, stored past, actual upcoming, actual past)
+    for every row whose counters disagree with the Show table."""
+    counts = _actual_counts(key)
+    upcoming = func.coalesce(counts.c.upcoming, 0)
+    past = func.coalesce(counts.c.past, 0)
+    return db.session.query(
+        model.id, model.upcoming_shows_count, model.past_shows_count,
+        upcoming, past)\
+        .outerjoin(counts, counts.c.id == model.id)\
+        .filter(or_(model.upcoming_shows_count != upcoming,
+                    model.past_shows_count != past))\
+        .order_by(model.id).all()
+
+
+def fix(model, key, ids=None, batch_size=1000):
+    # Recount the given rows (all rows when ids is None) from Show
+    fk = getattr(Show, key)
+
+    def counted(past):
+        return db.select([func.count(Show.id)])\
+            .where(fk == model.id).where(Show.counted_past == past)\
+            .as_scalar()
+
+    update = model.__table__.update().values(
+        upcoming_shows_count=counted(False), past_shows_count=counted(True))
+    if ids is None:
+        db.session.execute(update)
+    else:
+        for start in range(0, len(ids), batch_size):
+            db.session.execute(
+                update.where(model.id.in_(ids[start:start + batch_size])))
+    db.session.commit()
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+from flask import current_app, jsonify
+from sqlalchemy import exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    slow_checkout = 0.1
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            logger.error('pool exhausted: %s', self.status())
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            if waited > self.slow_checkout:
+                logger.warning('waited %.0fms for a connection: %s',
+                               waited * 1000, self.status())
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_out": self.checkedout(),
+                "idle": self.checkedin(),
+                "overflow": self.overflow(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(1000 * self.wait_total / self.checkouts, 3)
+                if self.checkouts else 0.0,
+                "wait_max_ms": round(1000 * self.wait_max, 3),
+            }
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    SQLite gets none: SQLAlchemy picks a pool that suits the file/memory
+    database and the pool-sizing arguments don't apply to it.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+        "pool_recycle": config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": config['DB_POOL_PRE_PING'],
+    }
+    if url.get_backend_name() in ('postgres', 'postgresql'):
+        # psycopg2's executemany() is a round trip per row: send INSERTs as
+        # multi-row VALUES and other statements (the counter UPDATEs) in
+        # pages instead, so batch writes cost a few round trips at any size
+        if url.drivername.partition('+')[2] in ('', 'psycopg2'):
+            options["executemany_mode"] = 'values'
+        if config['DB_STATEMENT_TIMEOUT']:
+            options["connect_args"] = {
+                "options": '-c statement_timeout={:d}'.format(
+                    config['DB_STATEMENT_TIMEOUT'])
+            }
+    return options
+
+
+def init_app(app, db):
+    InstrumentedQueuePool.slow_checkout = app.config['DB_POOL_SLOW_CHECKOUT']
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+        engine_options(app.config),
+        **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+
+    def pool_stats():
+        engines = {"default": db.get_engine(current_app)}
+        for bind in current_app.config.get('SQLALCHEMY_BINDS') or {}:
+            engines[bind] = db.get_engine(current_app, bind=bind)
+        return jsonify({
+            name: engine.pool.stats() if hasattr(engine.pool, 'stats')
+            else {"status": engine.pool.status()}
+            for name, engine in engines.items()
+        })
+
+    if app.debug or app.config['EXPOSE_INTERNAL_STATS']:
+        app.add_url_rule('/internal/pool', 'pool_stats', pool_stats)
@@ -0,0 +1,62 @@
+import time
+from flask import has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+
+#----------------------------------------------------------------------------#
+# Read/write routing.
+#----------------------------------------------------------------------------#
+
+# When a 'replica' bind is configured (SQLALCHEMY_BINDS), sessions opened
+# by GET/HEAD requests read from it; everything else (form posts, deletes,
+# CLI commands) uses the primary. A session that has flushed a write stays
+# on the primary, and so does the same browser for DB_REPLICA_STICKY_SECONDS
+# after it wrote, so the redirect that follows an edit shows the edit even
+# if the replica is lagging.
+
+REPLICA = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+_STICKY_KEY = '_db_primary_until'
+
+
+def pinned_to_primary():
+    # This browser wrote within the last DB_REPLICA_STICKY_SECONDS
+    return session.get(_STICKY_KEY, 0) >= time.time()
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, *args, **kwargs):
+        self.db = db
+        self.use_primary = False
+        super(RoutingSession, self).__init__(db, *args, **kwargs)
+
+    def _reads_from_replica(self):
+        if self.use_primary or self._flushing or not has_request_context():
+            return False
+        if REPLICA not in (self.app.config.get('SQLALCHEMY_BINDS') or {}):
+            return False
+        if request.method not in READ_METHODS:
+            return False
+        return not pinned_to_primary()
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._reads_from_replica():
+            return self.db.get_engine(self.app, bind=REPLICA)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _pin_to_primary(db_session, flush_context):
+    db_session.use_primary = True
+    if has_request_context():
+        sticky = db_session.app.config.get('DB_REPLICA_STICKY_SECONDS', 0)
+        if sticky:
+            session[_STICKY_KEY] = time.time() + sticky
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -13,6 +13,14 @@ def test():
         abort("Aborted at user request.")
 
 
+def build():
+    local("FLASK_APP=app flask build-assets && FLASK_APP=app flask compile-templates")
+
+
+def benchmark(baseline='benchmarks/baseline.json'):
+    local("python benchmarks/run.py --read-only --compare {}".format(baseline))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
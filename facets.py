@@ -0,0 +1,151 @@
+from collections import Counter
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+from models import db, Artist, ArtistGenre, Genre, Venue, VenueGenre
+
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+# Venue.genres (an ARRAY) and Artist.genres (comma separated text) are still
+# what the pages, forms and API read and write. VenueGenre/ArtistGenre
+# normalize them against the Genre lookup table, one row per (venue or
+# artist, genre), indexed by genre first. Writers call refresh() with the
+# ids they touched, in the same transaction, like areas.refresh(). Search
+# filters on them with one semi-join and counts its results per genre (the
+# facets) with one GROUP BY over the same index.
+#
+# Several genres narrow the results: a match must have all of them.
+
+LINKS = {
+    Venue: (VenueGenre.__table__, 'venue_id'),
+    Artist: (ArtistGenre.__table__, 'artist_id'),
+}
+
+
+def parse(value):
+    # Genre names in either column's format: a list, '{a,b}', 'a,b' or 'a'
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.strip('{}[]').split(',')
+    names = []
+    for name in value:
+        name = str(name).strip().strip('"').strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _dialect(executor):
+    # a Connection, or the session
+    if hasattr(executor, 'dialect'):
+        return executor.dialect
+    return executor.get_bind().dialect
+
+
+def genre_ids(names, executor=None):
+    # {name: id}, adding the names the Genre table doesn't have yet
+    executor = executor or db.session
+    names = set(names)
+    if not names:
+        return {}
+    table = Genre.__table__
+    lookup = db.select([table.c.name, table.c.id]).where(table.c.name.in_(names))
+    ids = dict(executor.execute(lookup).fetchall())
+    missing = sorted(names - set(ids))
+    if missing:
+        # concurrent writers may add the same name: skip it, read it back
+        if _dialect(executor).name == 'postgresql':
+            insert = postgresql.insert(table).on_conflict_do_nothing()
+        else:
+            insert = table.insert().prefix_with('OR IGNORE')
+        executor.execute(insert, [{"name": name} for name in missing])
+        ids = dict(executor.execute(lookup).fetchall())
+    return ids
+
+
+def _write(executor, model, rows):
+    # rows: [(id, genres column value)]; replaces those ids' links
+    table, key = LINKS[model]
+    if not rows:
+        return
+    named = [(id, parse(genres)) for id, genres in rows]
+    ids = genre_ids({n for _, names in named for n in names}, executor)
+    executor.execute(table.delete().where(
+        table.c[key].in_([id for id, _ in rows])))
+    links = [{key: id, "genre_id": ids[name]}
+             for id, names in named for name in names]
+    if links:
+        executor.execute(table.insert(), links)
+
+
+def refresh(model, ids, executor=None):
+    """Re-derive the genre links of these venues/artists; deleted ones lose
+    theirs. Runs on the session's transaction unless given a connection,
+    so call it before the commit that changes them."""
+    ids = sorted({int(id) for id in ids if id is not None})
+    if not ids:
+        return
+    if executor is None:
+        db.session.flush()
+        executor = db.session
+    source = model.__table__
+    rows = executor.execute(db.select([source.c.id, source.c.genres])
+                            .where(source.c.id.in_(ids))).fetchall()
+    found = {id for id, _ in rows}
+    _write(executor, model, list(rows) +
+           [(id, None) for id in ids if id not in found])
+
+
+def rebuild(model, executor=None, batch=5000):
+    # Every link from scratch, e.g. after loading data by hand
+    executor = executor or db.session
+    table, _ = LINKS[model]
+    source = model.__table__
+    executor.execute(table.delete())
+    last_id = 0
+    while True:
+        rows = executor.execute(
+            db.select([source.c.id, source.c.genres])
+            .where(source.c.id > last_id).order_by(source.c.id)
+            .limit(batch)).fetchall()
+        if not rows:
+            return
+        _write(executor, model, rows)
+        last_id = rows[-1][0]
+
+
+#  Filters and facets
+#  ----------------------------------------------------------------
+
+
+def with_genres(model, genres):
+    # model.id IN (ids linked to every one of these genres)
+    table, key = LINKS[model]
+    linked = db.select([table.c[key]])\
+        .select_from(table.join(Genre.__table__,
+                                Genre.__table__.c.id == table.c.genre_id))\
+        .where(Genre.__table__.c.name.in_(genres))\
+        .group_by(table.c[key])\
+        .having(func.count() == len(set(genres)))
+    return model.id.in_(linked)
+
+
+def counts_query(model, ids):
+    # (genre, count) over the rows whose id is in `ids`, a select or query
+    # of ids; most common genre first
+    table, key = LINKS[model]
+    count = func.count(table.c[key])
+    return db.session.query(Genre.name, count)\
+        .join(table, table.c.genre_id == Genre.id)\
+        .filter(table.c[key].in_(ids))\
+        .group_by(Genre.name)\
+        .order_by(count.desc(), Genre.name)
+
+
+def count(genre_lists):
+    # counts_query() for rows already in memory: [[genre, ...], ...]
+    counts = Counter(name for names in genre_lists for name in names)
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
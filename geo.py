@@ -0,0 +1,92 @@
+import csv
+import math
+import os
+from functools import lru_cache
+
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
+
+# Venues carry latitude/longitude and a geocell: the number of the cell of a
+# fixed CELL_DEGREES grid they fall in, numbered row by row. Cells next to
+# each other in a row are consecutive integers, so the cells under any
+# bounding box are one integer range per grid row, and a radius or box
+# search is that many range scans of ix_Venue_geocell -- a B-tree on any
+# database, no PostGIS needed. Coordinates come from the importer/API when
+# given, otherwise from data/places.csv, a bundled table of city centres
+# looked up by (city, state). Boxes crossing the antimeridian aren't
+# supported.
+
+PLACES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'data', 'places.csv')
+
+# ~5.5km of latitude per row; a 250km radius spans ~90 rows
+CELL_DEGREES = 0.05
+COLUMNS = int(round(360 / CELL_DEGREES))
+ROWS = int(round(180 / CELL_DEGREES))
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0
+
+
+def _place_key(city, state):
+    city = ' '.join((city or '').lower().split())
+    if city.startswith('saint '):
+        city = 'st. ' + city[len('saint '):]
+    return city, (state or '').strip().upper()
+
+
+@lru_cache(maxsize=1)
+def places():
+    with open(PLACES_PATH, newline='', encoding='utf-8') as f:
+        return {_place_key(r['city'], r['state']):
+                (float(r['latitude']), float(r['longitude']))
+                for r in csv.DictReader(f)}
+
+
+def cell(latitude, longitude):
+    row = min(int((latitude + 90) / CELL_DEGREES), ROWS - 1)
+    column = min(int((longitude + 180) / CELL_DEGREES), COLUMNS - 1)
+    return row * COLUMNS + column
+
+
+def position(city, state, latitude=None, longitude=None):
+    # The latitude/longitude/geocell column values for a venue: the given
+    # coordinates, else its city's, else all None
+    if latitude is None or longitude is None:
+        latitude, longitude = places().get(_place_key(city, state),
+                                           (None, None))
+    if latitude is None:
+        return {"latitude": None, "longitude": None, "geocell": None}
+    return {"latitude": latitude, "longitude": longitude,
+            "geocell": cell(latitude, longitude)}
+
+
+def locate(venue):
+    for key, value in position(venue.city, venue.state).items():
+        setattr(venue, key, value)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    # (south, west, north, east) around a circle
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE *
+                        max(math.cos(math.radians(latitude)), 0.01))
+    return (max(latitude - dlat, -90.0), max(longitude - dlng, -180.0),
+            min(latitude + dlat, 90.0), min(longitude + dlng, 180.0))
+
+
+def cell_ranges(south, west, north, east):
+    # [(first, last)] geocell range of each grid row under the box
+    first_row, first_column = divmod(cell(south, west), COLUMNS)
+    last_row, last_column = divmod(cell(north, east), COLUMNS)
+    return [(row * COLUMNS + first_column, row * COLUMNS + last_column)
+            for row in range(first_row, last_row + 1)]
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    # Great-circle (haversine) distance
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * \
+        math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
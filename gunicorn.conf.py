@@ -0,0 +1,15 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py
+# Loads wsgi.py once in the master and forks the workers from it (see there).
+# Each worker has its own connection pool: keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under max_connections.
+
+wsgi_app = 'wsgi:application'
+preload_app = True
+bind = os.environ.get('BIND', '0.0.0.0:{}'.format(os.environ.get('PORT', 8000)))
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+accesslog = '-'
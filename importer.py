@@ -0,0 +1,263 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+import dateutil.parser
+from models import db, Artist, ImportState, Venue, Show
+import areas
+import counters
+import facets
+import geo
+
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Streams CSV/JSONL files into Venue, Artist and Show in batches. Source rows
+# carry their own `id`; the ids they get here are kept in an in-memory map
+# so show rows can reference venues/artists by source id. Ids are allocated
+# up front for each batch, which lets a batch go in as one COPY (Postgres)
+# or one executemany INSERT without reading anything back.
+#
+# Each batch writes the progress (rows done per file and the id maps) to
+# the ImportState row named after the run, in the batch's own transaction:
+# a failed run picks up exactly where it left off when started again with
+# the same name, without loading any committed row twice.
+
+VENUE_COLUMNS = ('id', 'name', 'city', 'state', 'address', 'phone',
+                 'image_link', 'facebook_link', 'genres', 'website',
+                 'seeking_talent', 'seeking_description', 'latitude',
+                 'longitude', 'geocell', 'updated_at')
+ARTIST_COLUMNS = ('id', 'name', 'city', 'state', 'phone', 'genres',
+                  'image_link', 'facebook_link', 'seeking_venue', 'website',
+                  'seeking_description', 'updated_at')
+SHOW_COLUMNS = ('id', 'venue_id', 'artist_id', 'start_time', 'updated_at',
+                'counted_past')
+
+
+def read_rows(path):
+    # One dict per source row, streamed; .jsonl/.json lines or .csv
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _bool(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).strip().lower() in ('yes', 'true', '1', 't', 'y')
+
+
+def _float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _genre_list(value):
+    if value is None or isinstance(value, list):
+        return value
+    return [g.strip() for g in str(value).strip('{}').split(',') if g.strip()]
+
+
+def _genre_text(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    return value
+
+
+def allocate_ids(connection, table, count):
+    # Reserve `count` primary keys for rows inserted with explicit ids
+    if connection.dialect.name == 'postgresql':
+        return [r[0] for r in connection.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            ('"{}"'.format(table.name), count))]
+    # SQLite: a single writer, so max(id) is stable inside the transaction
+    start = connection.execute(
+        db.select([db.func.coalesce(db.func.max(table.c.id), 0)])).scalar()
+    return list(range(start + 1, start + 1 + count))
+
+
+class Importer(object):
+
+    def __init__(self, name=None, batch_size=1000, echo=print):
+        # name: the ImportState row to resume from and save to; None to
+        # keep no progress
+        self.name = name
+        self.batch_size = batch_size
+        self.echo = echo
+        self.state = {"files": {}, "venue": {}, "artist": {}}
+        self.connection = None
+
+    def _load_state(self):
+        if not self.name:
+            return
+        table = ImportState.__table__
+        saved = self.connection.execute(db.select([table.c.state]).where(
+            table.c.name == self.name)).scalar()
+        if saved:
+            self.state = json.loads(saved)
+
+    def _save_state(self):
+        # inside the batch's transaction
+        if not self.name:
+            return
+        table = ImportState.__table__
+        state = json.dumps(self.state)
+        updated = self.connection.execute(table.update().where(
+            table.c.name == self.name).values(state=state))
+        if not updated.rowcount:
+            self.connection.execute(table.insert().values(
+                name=self.name, state=state))
+
+    #  Rows
+    #  ----------------------------------------------------------------
+
+    def _venue(self, raw, stamp):
+        row = {c: raw.get(c) or None for c in VENUE_COLUMNS[1:-1]}
+        row['genres'] = _genre_list(raw.get('genres'))
+        row['seeking_talent'] = _bool(raw.get('seeking_talent'))
+        row.update(geo.position(row['city'], row['state'],
+                                _float(raw.get('latitude')),
+                                _float(raw.get('longitude'))))
+        row['updated_at'] = stamp
+        return row
+
+    def _artist(self, raw, stamp):
+        row = {c: raw.get(c) or None for c in ARTIST_COLUMNS[1:-1]}
+        row['genres'] = _genre_text(raw.get('genres'))
+        row['seeking_venue'] = _bool(raw.get('seeking_venue'))
+        row['updated_at'] = stamp
+        return row
+
+    def _show(self, raw, stamp):
+        venue_id = self.state["venue"].get(str(raw.get('venue_id')))
+        artist_id = self.state["artist"].get(str(raw.get('artist_id')))
+        if venue_id is None or artist_id is None:
+            return None
+        # an unreadable start time rejects the row, like an unknown id
+        start_time = raw.get('start_time')
+        try:
+            if isinstance(start_time, str):
+                start_time = dateutil.parser.parse(start_time)
+        except (ValueError, OverflowError, TypeError):
+            return None
+        if start_time is not None and not isinstance(start_time, datetime):
+            return None
+        return {'venue_id': venue_id, 'artist_id': artist_id,
+                'start_time': start_time, 'updated_at': stamp}
+
+    #  Writes
+    #  ----------------------------------------------------------------
+
+    def _copy(self, table, columns, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow([self._copy_value(row[c]) for c in columns])
+        buf.seek(0)
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                table.name, ', '.join(columns)), buf)
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _copy_value(value):
+        if value is None:
+            return ''
+        if isinstance(value, list):
+            return '{' + ','.join('"{}"'.format(
+                v.replace('\\', '\\\\').replace('"', '\\"')) for v in value) + '}'
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    def _insert(self, table, columns, rows):
+        if self.connection.dialect.name == 'postgresql':
+            self._copy(table, columns, rows)
+        else:
+            self.connection.execute(table.insert(), rows)
+
+    #  Files
+    #  ----------------------------------------------------------------
+
+    def load(self, kind, path):
+        model, columns, convert = {
+            'venue': (Venue, VENUE_COLUMNS, self._venue),
+            'artist': (Artist, ARTIST_COLUMNS, self._artist),
+            'show': (Show, SHOW_COLUMNS, self._show),
+        }[kind]
+        table = model.__table__
+
+        key = os.path.abspath(path)
+        done = self.state["files"].get(key, 0)
+        started, loaded, rejected = time.time(), 0, 0
+        if done:
+            self.echo('{}: resuming after row {}'.format(path, done))
+
+        batch = []
+        rows = read_rows(path)
+        for _ in range(done):
+            next(rows, None)
+
+        def flush():
+            nonlocal loaded, rejected, done
+            # row versions are UTC, show times (counters, areas) local
+            now, stamp = datetime.now(), datetime.utcnow()
+            converted = [(src, convert(raw, stamp)) for src, raw in batch]
+            good = [(src, row) for src, row in converted if row is not None]
+            rejected += len(converted) - len(good)
+            with self.connection.begin():
+                ids = allocate_ids(self.connection, table, len(good)) if good else []
+                for id, (src, row) in zip(ids, good):
+                    row['id'] = id
+                    if src is not None and kind != 'show':
+                        self.state[kind][str(src)] = id
+                if good:
+                    if kind == 'show':
+                        counters.add_shows([row for _, row in good], now,
+                                           self.connection)
+                    self._insert(table, columns, [row for _, row in good])
+                    if kind != 'artist':
+                        areas.refresh([row['venue_id' if kind == 'show' else 'id']
+                                       for _, row in good], now, self.connection)
+                    if kind != 'show':
+                        facets.refresh(model, [row['id'] for _, row in good],
+                                       self.connection)
+                self.state["files"][key] = done + len(batch)
+                self._save_state()
+            done += len(batch)
+            loaded += len(good)
+            elapsed = time.time() - started
+            self.echo('{}: {} rows loaded, {} rejected, {:.0f} rows/s'.format(
+                path, loaded, rejected, loaded / elapsed if elapsed else 0))
+            del batch[:]
+
+        for raw in rows:
+            batch.append((raw.get('id'), raw))
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+        return loaded, rejected
+
+    def run(self, venues=(), artists=(), shows=()):
+        # Venues and artists first: shows resolve their ids through the map
+        with db.engine.connect() as self.connection:
+            self._load_state()
+            for kind, paths in (('venue', venues), ('artist', artists),
+                                ('show', shows)):
+                for path in paths:
+                    self.load(kind, path)
@@ -0,0 +1,128 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+#----------------------------------------------------------------------------#
+# SQL instrumentation.
+#----------------------------------------------------------------------------#
+
+# Engine events time every statement. Inside a request the count and total
+# DB time are kept on `g` and, when SQL_TIMING_HEADERS is on (the default in
+# debug), returned as X-Query-Count and Server-Timing headers; statements
+# slower than SLOW_QUERY_SECONDS are logged with the route that ran them.
+# QueryRecorder collects the same data around any block of code, to catch
+# N+1 patterns in checks and benchmarks.
+
+_recorders = threading.local()
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'IN \((?:\?|%\(\w+\)s|%s|:\w+)(?:, ?(?:\?|%\(\w+\)s|%s|:\w+))*\)')
+
+
+def statement_shape(statement):
+    """The statement with literals and IN (...) lists folded, so the same
+    query with different parameters counts as one shape."""
+    shape = _LITERALS.sub('?', ' '.join(statement.split()))
+    return _IN_LISTS.sub('IN (...)', shape)
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+class QueryRecorder(object):
+    """Records statements run in this thread while the block is active.
+
+        with QueryRecorder(max_repeats=3) as queries:
+            client.get('/venues')
+        assert queries.count == 1
+
+    With `max_repeats`, leaving the block raises AssertionError if any
+    statement shape ran more often than that: the signature of an N+1.
+    """
+
+    def __init__(self, max_repeats=None):
+        self.max_repeats = max_repeats
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def shapes(self):
+        return Counter(statement_shape(s) for s in self.statements)
+
+    def repeated(self, limit):
+        return {s: n for s, n in self.shapes().items() if n > limit}
+
+    def __enter__(self):
+        if not hasattr(_recorders, 'active'):
+            _recorders.active = []
+        _recorders.active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _recorders.active.remove(self)
+        if exc_type is None and self.max_repeats is not None:
+            repeated = self.repeated(self.max_repeats)
+            if repeated:
+                raise AssertionError(
+                    'statements repeated more than {} times:\n{}'.format(
+                        self.max_repeats, '\n'.join(
+                            '{}x {}'.format(n, s) for s, n in repeated.items())))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+
+    for recorder in getattr(_recorders, 'active', ()):
+        recorder.statements.append(statement)
+
+    if not has_app_context():
+        return
+    stats = g.get('sql_stats')
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+    if elapsed > current_app.config['SLOW_QUERY_SECONDS']:
+        route = request.endpoint if has_request_context() else None
+        logger.warning('slow query (%.0fms) in %s: %s', elapsed * 1000,
+                       route or 'no request', ' '.join(statement.split()))
+
+
+def init_app(app):
+    app.config.setdefault('SLOW_QUERY_SECONDS', 0.25)
+    app.config.setdefault('SQL_TIMING_HEADERS', None)
+
+    @app.before_request
+    def start_sql_stats():
+        g.sql_stats = RequestStats()
+
+    @app.after_request
+    def sql_stats_headers(response):
+        # Streamed responses run most of their queries after this point
+        enabled = app.config['SQL_TIMING_HEADERS']
+        stats = g.get('sql_stats')
+        if stats is not None and (app.debug if enabled is None else enabled):
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers.add(
+                'Server-Timing', 'db;dur={:.2f};desc="{} queries"'.format(
+                    stats.duration * 1000, stats.count))
+        return response
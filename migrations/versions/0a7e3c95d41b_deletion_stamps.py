@@ -0,0 +1,39 @@
+"""Deletion stamps for the listing validators
+
+Revision ID: 0a7e3c95d41b
+Revises: f4c81d2a6b37
+Create Date: 2026-10-18 21:12:40.553018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7e3c95d41b'
+down_revision = 'f4c81d2a6b37'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Show', 'Venue', 'Artist')
+
+
+def upgrade():
+    op.create_table(
+        'Deletion',
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+    # One row per table up front, so record_deletion() only ever updates
+    if op.get_bind().dialect.name == 'postgresql':
+        now = "timezone('UTC', CURRENT_TIMESTAMP)"
+    else:
+        now = 'CURRENT_TIMESTAMP'
+    for table in TABLES:
+        op.execute("INSERT INTO \"Deletion\" (table_name, deleted_at) "
+                   "VALUES ('{}', {})".format(table, now))
+
+
+def downgrade():
+    op.drop_table('Deletion')
@@ -0,0 +1,54 @@
+"""trigram search indexes on Venue and Artist
+
+Revision ID: 2f64b9e0a7c3
+Revises: 8d3e6c21f7a0
+Create Date: 2026-10-18 11:40:05.560871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f64b9e0a7c3'
+down_revision = '8d3e6c21f7a0'
+branch_labels = None
+depends_on = None
+
+# Same expressions as search.document(); Postgres only uses an expression
+# index when the query repeats the indexed expression exactly.
+VENUE_DOCUMENT = (
+    "lower(coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || "
+    "coalesce(state, '') || ' ' || fyyur_array_to_text(genres))"
+)
+ARTIST_DOCUMENT = (
+    "lower(coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || "
+    "coalesce(state, '') || ' ' || coalesce(genres, ''))"
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite/dev runs use the in-process index in search.py
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string() is only STABLE, which an index expression can't use
+    op.execute(
+        "CREATE OR REPLACE FUNCTION fyyur_array_to_text(varchar[]) "
+        "RETURNS text LANGUAGE sql IMMUTABLE AS "
+        "$$ SELECT coalesce(array_to_string($1, ' '), '') $$"
+    )
+    op.execute('CREATE INDEX ix_Venue_search_trgm ON "Venue" '
+               'USING gin ((' + VENUE_DOCUMENT + ') gin_trgm_ops)')
+    op.execute('CREATE INDEX ix_Artist_search_trgm ON "Artist" '
+               'USING gin ((' + ARTIST_DOCUMENT + ') gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('DROP INDEX IF EXISTS "ix_Artist_search_trgm"')
+    op.execute('DROP INDEX IF EXISTS "ix_Venue_search_trgm"')
+    op.execute('DROP FUNCTION IF EXISTS fyyur_array_to_text(varchar[])')
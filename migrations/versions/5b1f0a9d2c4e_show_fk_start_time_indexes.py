@@ -0,0 +1,28 @@
+"""composite indexes on Show foreign keys and start_time
+
+Revision ID: 5b1f0a9d2c4e
+Revises: c3888f91c58f
+Create Date: 2026-10-18 09:12:31.402113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0a9d2c4e'
+down_revision = 'c3888f91c58f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show',
+                    ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,48 @@
+"""VenueArea summary table for /venues
+
+Revision ID: 6c0e5f8b2d19
+Revises: a41c7d93e5b8
+Create Date: 2026-10-18 15:02:37.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c0e5f8b2d19'
+down_revision = 'a41c7d93e5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'VenueArea',
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=True),
+        sa.Column('state', sa.String(length=120), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('num_upcoming_shows', sa.Integer(), nullable=False),
+        sa.Column('next_rollover', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('venue_id')
+    )
+    op.create_index('ix_VenueArea_city_state_venue_id', 'VenueArea',
+                    ['city', 'state', 'venue_id'], unique=False)
+    op.create_index(op.f('ix_VenueArea_next_rollover'), 'VenueArea',
+                    ['next_rollover'], unique=False)
+
+    # Same rows as areas.rebuild()
+    op.execute(
+        'INSERT INTO "VenueArea" (venue_id, city, state, name, '
+        'num_upcoming_shows, next_rollover) '
+        'SELECT v.id, v.city, v.state, v.name, count(s.id), min(s.start_time) '
+        'FROM "Venue" v LEFT OUTER JOIN "Show" s '
+        'ON s.venue_id = v.id AND s.start_time > CURRENT_TIMESTAMP '
+        'GROUP BY v.id, v.city, v.state, v.name')
+
+
+def downgrade():
+    op.drop_index(op.f('ix_VenueArea_next_rollover'), table_name='VenueArea')
+    op.drop_index('ix_VenueArea_city_state_venue_id', table_name='VenueArea')
+    op.drop_table('VenueArea')
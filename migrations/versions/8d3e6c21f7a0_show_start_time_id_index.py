@@ -0,0 +1,25 @@
+"""index on Show (start_time, id) for keyset pagination
+
+Revision ID: 8d3e6c21f7a0
+Revises: 5b1f0a9d2c4e
+Create Date: 2026-10-18 10:02:47.118530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3e6c21f7a0'
+down_revision = '5b1f0a9d2c4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_start_time_id', 'Show',
+                    ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
@@ -0,0 +1,29 @@
+"""Bulk import progress
+
+Revision ID: 9c27d4b8e1f6
+Revises: 0a7e3c95d41b
+Create Date: 2026-10-18 22:03:17.408216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c27d4b8e1f6'
+down_revision = '0a7e3c95d41b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ImportState',
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('state', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('ImportState')
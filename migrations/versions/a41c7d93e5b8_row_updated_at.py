@@ -0,0 +1,39 @@
+"""updated_at row versions on Show, Venue and Artist
+
+Revision ID: a41c7d93e5b8
+Revises: 2f64b9e0a7c3
+Create Date: 2026-10-18 13:21:54.907316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41c7d93e5b8'
+down_revision = '2f64b9e0a7c3'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Show', 'Venue', 'Artist')
+
+
+def upgrade():
+    # updated_at is naive UTC (models.py); SQLite's CURRENT_TIMESTAMP is
+    # UTC already, Postgres' is in the session time zone
+    if op.get_bind().dialect.name == 'postgresql':
+        now = "timezone('UTC', CURRENT_TIMESTAMP)"
+    else:
+        now = 'CURRENT_TIMESTAMP'
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       nullable=True))
+        op.execute('UPDATE "{}" SET updated_at = {}'.format(table, now))
+        op.create_index('ix_{}_updated_at'.format(table), table,
+                        ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index('ix_{}_updated_at'.format(table), table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,51 @@
+"""upcoming/past show counters on Venue and Artist
+
+Revision ID: d7a2c4e96b31
+Revises: 6c0e5f8b2d19
+Create Date: 2026-10-18 16:10:42.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2c4e96b31'
+down_revision = '6c0e5f8b2d19'
+branch_labels = None
+depends_on = None
+
+TARGETS = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('counted_past', sa.Boolean(),
+                                    server_default=sa.false(), nullable=False))
+    op.execute('UPDATE "Show" SET counted_past = (start_time IS NULL '
+               'OR start_time <= CURRENT_TIMESTAMP)')
+    op.create_index('ix_Show_rollover', 'Show', ['start_time', 'id'],
+                    unique=False,
+                    postgresql_where=sa.text('NOT counted_past'),
+                    sqlite_where=sa.text('NOT counted_past'))
+
+    # Same counts as counters.fix()
+    for table, fk in TARGETS:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{fk} = "{table}".id AND NOT "Show".counted_past), '
+            'past_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{fk} = "{table}".id AND "Show".counted_past)'
+            .format(table=table, fk=fk))
+
+
+def downgrade():
+    for table, _ in TARGETS:
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_index('ix_Show_rollover', table_name='Show')
+    op.drop_column('Show', 'counted_past')
@@ -0,0 +1,90 @@
+"""venue latitude/longitude and grid cell
+
+Revision ID: e2b94f1c7a58
+Revises: d7a2c4e96b31
+Create Date: 2026-10-18 19:05:13.204816
+
+"""
+import csv
+import os
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b94f1c7a58'
+down_revision = 'd7a2c4e96b31'
+branch_labels = None
+depends_on = None
+
+# As in geo.py when this revision was written
+PLACES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', '..', 'data', 'places.csv')
+CELL_DEGREES = 0.05
+COLUMNS = 7200
+ROWS = 3600
+BATCH = 5000
+
+
+def _key(city, state):
+    city = ' '.join((city or '').lower().split())
+    if city.startswith('saint '):
+        city = 'st. ' + city[len('saint '):]
+    return city, (state or '').strip().upper()
+
+
+def _cell(latitude, longitude):
+    row = min(int((latitude + 90) / CELL_DEGREES), ROWS - 1)
+    column = min(int((longitude + 180) / CELL_DEGREES), COLUMNS - 1)
+    return row * COLUMNS + column
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geocell', sa.Integer(), nullable=True))
+
+    # Geocode existing venues from their city, in id order, one batch of
+    # reads and one executemany per BATCH rows
+    with open(PLACES_PATH, newline='', encoding='utf-8') as f:
+        places = {_key(r['city'], r['state']):
+                  (float(r['latitude']), float(r['longitude']))
+                  for r in csv.DictReader(f)}
+    venue = sa.table('Venue', sa.column('id', sa.Integer),
+                     sa.column('city', sa.String), sa.column('state', sa.String),
+                     sa.column('latitude', sa.Float),
+                     sa.column('longitude', sa.Float),
+                     sa.column('geocell', sa.Integer))
+    update = venue.update().where(venue.c.id == sa.bindparam('_id')).values(
+        latitude=sa.bindparam('_latitude'),
+        longitude=sa.bindparam('_longitude'),
+        geocell=sa.bindparam('_geocell'))
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([venue.c.id, venue.c.city, venue.c.state])
+            .where(venue.c.id > last_id).order_by(venue.c.id)
+            .limit(BATCH)).fetchall()
+        if not rows:
+            break
+        located = []
+        for id, city, state in rows:
+            place = places.get(_key(city, state))
+            if place:
+                located.append({'_id': id, '_latitude': place[0],
+                                '_longitude': place[1],
+                                '_geocell': _cell(*place)})
+        if located:
+            connection.execute(update, located)
+        last_id = rows[-1][0]
+
+    op.create_index('ix_Venue_geocell', 'Venue',
+                    ['geocell', 'latitude', 'longitude'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_geocell', table_name='Venue')
+    op.drop_column('Venue', 'geocell')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -0,0 +1,111 @@
+"""Genre lookup table and venue/artist genre links
+
+Revision ID: f4c81d2a6b37
+Revises: e2b94f1c7a58
+Create Date: 2026-10-18 19:48:51.630127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c81d2a6b37'
+down_revision = 'e2b94f1c7a58'
+branch_labels = None
+depends_on = None
+
+BATCH = 5000
+
+
+def _parse(value):
+    # As facets.parse() when this revision was written
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.strip('{}[]').split(',')
+    names = []
+    for name in value:
+        name = str(name).strip().strip('"').strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _backfill(connection, genre, source, links, key):
+    # Links for every row of source, BATCH rows per read, one executemany
+    # each for new genres and for links
+    ids = dict(connection.execute(
+        sa.select([genre.c.name, genre.c.id])).fetchall())
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([source.c.id, source.c.genres])
+            .where(source.c.id > last_id).order_by(source.c.id)
+            .limit(BATCH)).fetchall()
+        if not rows:
+            return
+        named = [(id, _parse(genres)) for id, genres in rows]
+        new = sorted({n for _, names in named for n in names} - set(ids))
+        if new:
+            connection.execute(genre.insert(), [{"name": n} for n in new])
+            ids = dict(connection.execute(
+                sa.select([genre.c.name, genre.c.id])).fetchall())
+        values = [{key: id, "genre_id": ids[n]}
+                  for id, names in named for n in names]
+        if values:
+            connection.execute(links.insert(), values)
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    op.create_table(
+        'Genre',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_table(
+        'VenueGenre',
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_table(
+        'ArtistGenre',
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+
+    # Same rows as facets.rebuild(), loaded before the genre-first indexes
+    # so they are built once at the end
+    connection = op.get_bind()
+    genre = sa.table('Genre', sa.column('id', sa.Integer),
+                     sa.column('name', sa.String))
+    for source, links, key in (('Venue', 'VenueGenre', 'venue_id'),
+                               ('Artist', 'ArtistGenre', 'artist_id')):
+        _backfill(connection, genre,
+                  sa.table(source, sa.column('id', sa.Integer),
+                           sa.column('genres')),
+                  sa.table(links, sa.column(key, sa.Integer),
+                           sa.column('genre_id', sa.Integer)),
+                  key)
+
+    op.create_index('ix_VenueGenre_genre_id_venue_id', 'VenueGenre',
+                    ['genre_id', 'venue_id'], unique=False)
+    op.create_index('ix_ArtistGenre_genre_id_artist_id', 'ArtistGenre',
+                    ['genre_id', 'artist_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ArtistGenre_genre_id_artist_id', table_name='ArtistGenre')
+    op.drop_index('ix_VenueGenre_genre_id_venue_id', table_name='VenueGenre')
+    op.drop_table('ArtistGenre')
+    op.drop_table('VenueGenre')
+    op.drop_table('Genre')
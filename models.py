@@ -1,7 +1,8 @@
+from datetime import datetime
 import dateutil.parser
 import babel
-from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+from dbrouting import RoutingSQLAlchemy
+db = RoutingSQLAlchemy()
 
 
 #----------------------------------------------------------------------------#
@@ -25,6 +26,26 @@ class Show(db.Model):
     start_time = db.Column(db.DateTime, nullable=True,
                            default="2021-01-23 21:36:22")
 
+    # which Venue/Artist counter this show is in, see counters.py
+    counted_past = db.Column(db.Boolean, nullable=False, default=False,
+                             server_default=db.false())
+
+    # row version, used for ETag/Last-Modified validators; naive UTC, as
+    # Last-Modified is read
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
+
+    # Shows are always looked up by venue/artist and a start_time range
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # only the shows still waiting to roll over to past
+        db.Index('ix_Show_rollover', 'start_time', 'id',
+                 postgresql_where=db.text('NOT counted_past'),
+                 sqlite_where=db.text('NOT counted_past')),
+    )
+
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
@@ -37,14 +58,30 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(50)))
+    # JSON list on SQLite (dev, tests), which has no array type
+    genres = db.Column(db.ARRAY(db.String(50)).with_variant(db.JSON(), 'sqlite'))
     website = db.Column(db.String(500))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
+    # location and grid cell, see geo.py
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geocell = db.Column(db.Integer)
 
     # shows relation
     shows = db.relationship('Show', backref='venues', lazy=True)
 
+    # radius/box searches: geocell ranges, coordinates checked in the index
+    __table_args__ = (
+        db.Index('ix_Venue_geocell', 'geocell', 'latitude', 'longitude'),
+    )
+
     def __repr__(self):
         return f'<Venue ID: {self.id}, name: {self.name}>'
 
@@ -63,9 +100,91 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean)
     website = db.Column(db.String(500))
     seeking_description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
 
     # shows relation
     shows = db.relationship('Show', backref='artists', lazy=True)
 
     def __repr__(self):
         return f'<Artist ID: {self.id}, name: {self.name}>'
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Genre ID: {self.id}, name: {self.name}>'
+
+
+class VenueGenre(db.Model):
+    # Derived from Venue.genres (see facets.py): one row per venue and genre
+    __tablename__ = 'VenueGenre'
+
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'Venue.id', ondelete='CASCADE'), primary_key=True)
+    genre_id = db.Column(db.Integer, db.ForeignKey(
+        'Genre.id'), primary_key=True)
+
+    # genre filters and facet counts read by genre
+    __table_args__ = (
+        db.Index('ix_VenueGenre_genre_id_venue_id', 'genre_id', 'venue_id'),
+    )
+
+
+class ArtistGenre(db.Model):
+    # Derived from Artist.genres, like VenueGenre
+    __tablename__ = 'ArtistGenre'
+
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'Artist.id', ondelete='CASCADE'), primary_key=True)
+    genre_id = db.Column(db.Integer, db.ForeignKey(
+        'Genre.id'), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_ArtistGenre_genre_id_artist_id', 'genre_id', 'artist_id'),
+    )
+
+
+class Deletion(db.Model):
+    # When rows were last deleted from each table (UTC), for the listing
+    # validators: a delete leaves no updated_at behind
+    __tablename__ = 'Deletion'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+
+class ImportState(db.Model):
+    # Progress of a bulk import (importer.py) as JSON, written in the same
+    # transaction as each batch it records
+    __tablename__ = 'ImportState'
+
+    name = db.Column(db.String(255), primary_key=True)
+    state = db.Column(db.Text, nullable=False)
+
+
+class VenueArea(db.Model):
+    # Derived from Venue and Show (see areas.py): one row per venue, read in
+    # (city, state, venue_id) order to render /venues without a GROUP BY
+    __tablename__ = 'VenueArea'
+
+    venue_id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    name = db.Column(db.String)
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    # start of the soonest upcoming show: the count is stale once it passes
+    next_rollover = db.Column(db.DateTime, index=True)
+
+    __table_args__ = (
+        db.Index('ix_VenueArea_city_state_venue_id',
+                 'city', 'state', 'venue_id'),
+    )
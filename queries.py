@@ -0,0 +1,400 @@
+import math
+from datetime import datetime, timezone
+from itertools import groupby
+from sqlalchemy import case, func, or_, tuple_
+from sqlalchemy.orm import aliased, joinedload
+from models import db, Artist, Deletion, Venue, VenueArea, Show
+import geo
+
+
+#----------------------------------------------------------------------------#
+# Query layer.
+#----------------------------------------------------------------------------#
+
+# Shared read queries for the listing and search pages. Upcoming show counts
+# are the counter columns kept by counters.py, so listing or searching any
+# number of venues/artists doesn't touch Show at all.
+
+
+def _with_upcoming_counts(model):
+    return db.session.query(
+        model.id, model.name, model.city, model.state,
+        model.upcoming_shows_count.label('num_upcoming_shows'))
+
+
+def venues_with_upcoming_counts():
+    return _with_upcoming_counts(Venue)
+
+
+def artists_with_upcoming_counts():
+    return _with_upcoming_counts(Artist)
+
+
+def group_areas(rows):
+    for (city, state), group in groupby(rows, key=lambda r: (r.city, r.state)):
+        yield {
+            "city": city,
+            "state": state,
+            "venues": ({
+                "id": r.id,
+                "name": r.name,
+                "num_upcoming_shows": r.num_upcoming_shows
+            } for r in group)
+        }
+
+
+def venue_areas_query(now=None):
+    # One ordered read of the area summary (see areas.py). Rows whose next
+    # show has started since they were written are recounted in place; the
+    # CASE only runs that subquery for them.
+    now = now or datetime.now()
+    recount = db.session.query(func.count(Show.id))\
+        .filter(Show.venue_id == VenueArea.venue_id)\
+        .filter(Show.start_time > now).as_scalar()
+    upcoming = case([(VenueArea.next_rollover <= now, recount)],
+                    else_=VenueArea.num_upcoming_shows)
+    return db.session.query(
+        VenueArea.venue_id.label('id'), VenueArea.name,
+        VenueArea.city, VenueArea.state,
+        upcoming.label('num_upcoming_shows'))\
+        .order_by(VenueArea.city, VenueArea.state, VenueArea.venue_id)
+
+
+def venue_areas(now=None):
+    # Venues grouped by (city, state) with their upcoming show counts
+    rows = venue_areas_query(now).all()
+    return [dict(area, venues=list(area["venues"]))
+            for area in group_areas(rows)]
+
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+# Box and radius searches read one ix_Venue_geocell range per grid row under
+# the box (geo.cell_ranges), with the exact bounds checked on the index
+# entries; no other venue row is looked at.
+
+
+def _located_venues():
+    return db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state,
+        Venue.latitude, Venue.longitude,
+        Venue.upcoming_shows_count.label('num_upcoming_shows'))
+
+
+def venues_in_box(south, west, north, east):
+    ranges = geo.cell_ranges(south, west, north, east)
+    return _located_venues()\
+        .filter(or_(*[Venue.geocell.between(a, b) for a, b in ranges]))\
+        .filter(Venue.latitude.between(south, north))\
+        .filter(Venue.longitude.between(west, east))
+
+
+def venues_near(latitude, longitude, radius_km):
+    # Nearest first. Distances in SQL are equirectangular (plain arithmetic
+    # on any database), well within 1% of the great-circle distance at
+    # these radii.
+    south, west, north, east = geo.bounding_box(latitude, longitude, radius_km)
+    dy = Venue.latitude - latitude
+    dx = (Venue.longitude - longitude) * math.cos(math.radians(latitude))
+    distance2 = dy * dy + dx * dx
+    return venues_in_box(south, west, north, east)\
+        .filter(distance2 <= (radius_km / geo.KM_PER_DEGREE) ** 2)\
+        .order_by(distance2, Venue.id)
+
+
+#----------------------------------------------------------------------------#
+# Detail pages.
+#----------------------------------------------------------------------------#
+
+# A venue/artist page is served from one query: the entity, its shows and
+# each show's artist/venue come back in a single joined SELECT.
+
+
+def venue_with_shows_query(venue_id):
+    # Venue LEFT JOIN Show LEFT JOIN Artist, each join by index. Shows whose
+    # artist is gone (artist_id NULL) come back with no artist: split_shows
+    # leaves them out, like venue_shows_query does. (An inner Show-Artist
+    # join nests as LEFT JOIN (Show JOIN Artist), which SQLite runs as a
+    # full scan of Show.)
+    return Venue.query.options(joinedload(Venue.shows)
+                               .joinedload(Show.artists))\
+        .filter(Venue.id == venue_id)
+
+
+def venue_with_shows(venue_id):
+    return venue_with_shows_query(venue_id).one_or_none()
+
+
+def artist_with_shows_query(artist_id):
+    return Artist.query.options(joinedload(Artist.shows)
+                                .joinedload(Show.venues))\
+        .filter(Artist.id == artist_id)
+
+
+def artist_with_shows(artist_id):
+    return artist_with_shows_query(artist_id).one_or_none()
+
+
+def _shows_side(query, upcoming, now):
+    if upcoming:
+        return query.filter(Show.start_time > now).order_by(Show.start_time, Show.id)
+    return query.filter(or_(Show.start_time <= now, Show.start_time.is_(None)))\
+        .order_by(Show.start_time, Show.id)
+
+
+def venue_shows_query(venue_id, upcoming, now=None):
+    # One half of a venue page's shows, for fetching past and upcoming
+    # concurrently (asgi.py); venue_with_shows gets both in one query
+    query = db.session.query(
+        Show.start_time, Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'))\
+        .join(Artist, Artist.id == Show.artist_id)\
+        .filter(Show.venue_id == venue_id)
+    return _shows_side(query, upcoming, now or datetime.now())
+
+
+def artist_shows_query(artist_id, upcoming, now=None):
+    query = db.session.query(
+        Show.start_time, Venue.id.label('venue_id'),
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'))\
+        .join(Venue, Venue.id == Show.venue_id)\
+        .filter(Show.artist_id == artist_id)
+    return _shows_side(query, upcoming, now or datetime.now())
+
+
+def split_shows(shows, now=None, other=None):
+    # (past, upcoming), each ordered by start time, in one pass. other: the
+    # relationship to the show's artist or venue ('artists', 'venues');
+    # shows without one are left out.
+    now = now or datetime.now()
+    if other:
+        shows = [s for s in shows if getattr(s, other) is not None]
+    past, upcoming = [], []
+    for s in sorted(shows, key=lambda s: s.start_time or datetime.min):
+        (upcoming if s.start_time and s.start_time > now else past).append(s)
+    return past, upcoming
+
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+# Pages are addressed by the sort key of their first/last row instead of an
+# OFFSET, so fetching page N is one index range scan whatever N is.
+
+
+def encode_cursor(values):
+    return '_'.join(v.isoformat() if isinstance(v, datetime) else str(v)
+                    for v in values)
+
+
+def decode_cursor(cursor, types):
+    # Raises ValueError on a malformed cursor
+    parts = cursor.split('_')
+    if len(parts) != len(types):
+        raise ValueError('bad cursor: {}'.format(cursor))
+    return tuple(datetime.fromisoformat(p) if t is datetime else t(p)
+                 for p, t in zip(parts, types))
+
+
+def keyset_query(query, columns, after=None, before=None, limit=30):
+    # columns: the unique sort key, e.g. (Show.start_time, Show.id).
+    # One row more than the page, to tell whether there is a next page.
+    # Rows with a NULL in the key (shows without a start time) are left
+    # out: no cursor can point past them.
+    key = tuple_(*columns) if len(columns) > 1 else columns[0]
+    query = query.filter(*[c.isnot(None) for c in columns])
+
+    def bound(values):
+        return tuple_(*values) if len(values) > 1 else values[0]
+
+    if before is not None:
+        return query.filter(key < bound(before))\
+            .order_by(*[c.desc() for c in columns]).limit(limit + 1)
+    if after is not None:
+        query = query.filter(key > bound(after))
+    return query.order_by(*columns).limit(limit + 1)
+
+
+def keyset_result(rows, columns, after=None, before=None, limit=30):
+    # The page for the rows keyset_query returned
+    if before is not None:
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_prev, has_next = has_more, True
+    else:
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = after is not None
+
+    def cursor_of(row):
+        return encode_cursor([getattr(row, c.key) for c in columns])
+
+    return {
+        "items": rows,
+        "next": cursor_of(rows[-1]) if rows and has_next else None,
+        "prev": cursor_of(rows[0]) if rows and has_prev else None,
+    }
+
+
+def keyset_page(query, columns, after=None, before=None, limit=30):
+    rows = keyset_query(query, columns, after, before, limit).all()
+    return keyset_result(rows, columns, after, before, limit)
+
+
+SHOWS_KEY = (Show.start_time, Show.id)
+ARTISTS_KEY = (Artist.id,)
+
+
+def shows_query():
+    return db.session.query(
+        Show.id, Show.start_time, Show.venue_id, Show.artist_id,
+        Venue.name.label('venue_name'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'))\
+        .join(Venue, Venue.id == Show.venue_id)\
+        .join(Artist, Artist.id == Show.artist_id)
+
+
+def artists_query():
+    return db.session.query(Artist.id, Artist.name)
+
+
+def shows_page(after=None, before=None, limit=30):
+    return keyset_page(shows_query(), SHOWS_KEY, after, before, limit)
+
+
+def artists_page(after=None, before=None, limit=30):
+    return keyset_page(artists_query(), ARTISTS_KEY, after, before, limit)
+
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+# Generators over a server-side cursor (yield_per) for the streamed listing
+# pages: rows are fetched in batches while the template renders, so memory
+# stays flat however large the table is.
+
+
+def iter_venue_areas(now=None, batch=500):
+    return group_areas(venue_areas_query(now).yield_per(batch))
+
+
+def iter_shows(batch=500):
+    return shows_query().order_by(*SHOWS_KEY).yield_per(batch)
+
+
+def iter_artists(batch=500):
+    return artists_query().order_by(*ARTISTS_KEY).yield_per(batch)
+
+
+#----------------------------------------------------------------------------#
+# Validators.
+#----------------------------------------------------------------------------#
+
+# Cheap versions of what a page shows, for ETag/Last-Modified: the newest
+# updated_at of every row the page renders, the last delete from its tables
+# (Deletion, see record_deletion) or for a detail page its show count, and
+# the latest show start that has passed (a page changes when a show moves
+# from upcoming to past). Each is one indexed lookup. Row stamps are UTC;
+# show start times are local and are converted for Last-Modified.
+
+
+def _utc(local):
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def version_of(row):
+    # (values, last modified) from a version query's row, None if no row.
+    # The last value is always the passed show start (_passed_shows).
+    if row is None:
+        return None
+    row = tuple(row)
+    stamps = [v for v in row[:-1] if isinstance(v, datetime)]
+    if isinstance(row[-1], datetime):
+        stamps.append(_utc(row[-1]))
+    return row, max(stamps) if stamps else None
+
+
+def _passed_shows(now, criterion=None):
+    # Start time of the most recent show that is no longer upcoming
+    past = aliased(Show)
+    query = db.session.query(func.max(past.start_time))\
+        .filter(past.start_time <= now)
+    if criterion is not None:
+        query = query.filter(criterion(past))
+    return query.as_scalar()
+
+
+def venue_version_query(venue_id, now=None):
+    now = now or datetime.now()
+    return db.session.query(
+        Venue.updated_at, func.max(Show.updated_at),
+        func.max(Artist.updated_at), func.count(Show.id),
+        _passed_shows(now, lambda s: s.venue_id == venue_id))\
+        .outerjoin(Show, Show.venue_id == Venue.id)\
+        .outerjoin(Artist, Artist.id == Show.artist_id)\
+        .filter(Venue.id == venue_id)\
+        .group_by(Venue.id, Venue.updated_at)
+
+
+def artist_version_query(artist_id, now=None):
+    now = now or datetime.now()
+    return db.session.query(
+        Artist.updated_at, func.max(Show.updated_at),
+        func.max(Venue.updated_at), func.count(Show.id),
+        _passed_shows(now, lambda s: s.artist_id == artist_id))\
+        .outerjoin(Show, Show.artist_id == Artist.id)\
+        .outerjoin(Venue, Venue.id == Show.venue_id)\
+        .filter(Artist.id == artist_id)\
+        .group_by(Artist.id, Artist.updated_at)
+
+
+def _newest(model):
+    # MAX of the indexed updated_at: one end of the index, not a scan
+    return db.session.query(func.max(model.updated_at)).as_scalar()
+
+
+def _last_deletion(models):
+    return db.session.query(func.max(Deletion.deleted_at))\
+        .filter(Deletion.table_name.in_([m.__tablename__ for m in models]))\
+        .as_scalar()
+
+
+def listing_version_query(*models, now=None):
+    # Newest updated_at of each table a listing renders and its last delete
+    now = now or datetime.now()
+    return db.session.query(*[_newest(m) for m in models] +
+                            [_last_deletion(models), _passed_shows(now)])
+
+
+def record_deletion(*models, executor=None):
+    # Call in the transaction that deletes rows of these tables
+    executor = executor or db.session
+    table = Deletion.__table__
+    now = datetime.utcnow()
+    for model in models:
+        name = model.__tablename__
+        updated = executor.execute(table.update()
+                                   .where(table.c.table_name == name)
+                                   .values(deleted_at=now))
+        if not updated.rowcount:
+            executor.execute(table.insert().values(table_name=name,
+                                                   deleted_at=now))
+
+
+def venue_version(venue_id, now=None):
+    return version_of(venue_version_query(venue_id, now).first())
+
+
+def artist_version(artist_id, now=None):
+    return version_of(artist_version_query(artist_id, now).first())
+
+
+def listing_version(*models, now=None):
+    return version_of(listing_version_query(*models, now=now).first())
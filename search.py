@@ -0,0 +1,238 @@
+import threading
+from flask import current_app
+from sqlalchemy import case, func
+from models import db, Artist, Venue
+import facets
+import queries
+
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Venue/artist search over name, city, state and genres, ranked
+# exact name > name prefix > name substring > other field match.
+#
+# On Postgres the match runs against a trigram (pg_trgm) GIN index on a
+# lower-cased document expression, see migration 2f64b9e0a7c3. Other
+# databases (SQLite in dev) get an in-process inverted trigram index with
+# the same interface; it is per process and rebuilt on start, so it is a
+# dev fallback, not something to run behind several workers.
+#
+# Either can be narrowed to venues/artists with all of some genres, and
+# returns how many of the results have each genre (see facets.py).
+
+KINDS = {'venue': Venue, 'artist': Artist}
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _genres_text(model):
+    # Venue.genres is an ARRAY on Postgres (a variant type wrapping it)
+    if isinstance(getattr(model.genres.type, 'impl', model.genres.type),
+                  db.ARRAY):
+        # immutable wrapper around array_to_string, created by the migration
+        return func.fyyur_array_to_text(model.genres)
+    return func.coalesce(model.genres, '')
+
+
+def document(model):
+    # Must stay identical to the indexed expression in the migration
+    return func.lower(
+        func.coalesce(model.name, '') + ' ' +
+        func.coalesce(model.city, '') + ' ' +
+        func.coalesce(model.state, '') + ' ' +
+        _genres_text(model))
+
+
+def _rank(name, term):
+    # 0 exact, 1 prefix, 2 substring of the name, 3 matched another field
+    if name == term:
+        return 0
+    if name.startswith(term):
+        return 1
+    if term in name:
+        return 2
+    return 3
+
+
+def result(rows, total, page, limit, counts=(), genres=()):
+    return {
+        "count": total,
+        "page": page,
+        "pages": max(1, (total + limit - 1) // limit),
+        "genres": list(genres),
+        "facets": [{"genre": genre, "count": n} for genre, n in counts],
+        "data": [{
+            "id": r.id,
+            "name": r.name,
+            "num_upcoming_shows": r.num_upcoming_shows
+        } for r in rows]
+    }
+
+
+def _counts_query(model):
+    if model is Venue:
+        return queries.venues_with_upcoming_counts()
+    return queries.artists_with_upcoming_counts()
+
+
+class PostgresSearch(object):
+
+    def queries(self, model, term, page, limit, genres):
+        # (total count, page rows, genre counts): independent, so they can
+        # run concurrently
+        pattern = '%' + _escape_like(term) + '%'
+        name = func.lower(func.coalesce(model.name, ''))
+        rank = case([
+            (name == term, 0),
+            (name.like(_escape_like(term) + '%', escape='\\'), 1),
+            (name.like(pattern, escape='\\'), 2),
+        ], else_=3)
+
+        matches = _counts_query(model)
+        if term:
+            matches = matches.filter(
+                document(model).like(pattern, escape='\\'))
+        if genres:
+            matches = matches.filter(facets.with_genres(model, genres))
+        total = matches.order_by(None).from_self(func.count())
+        rows = matches.order_by(rank, model.name, model.id)\
+            .offset((page - 1) * limit).limit(limit)
+        counts = facets.counts_query(
+            model, matches.order_by(None).with_entities(model.id))
+        return total, rows, counts
+
+    def search(self, model, term, page, limit, genres):
+        total, rows, counts = self.queries(model, term, page, limit, genres)
+        return result(rows.all(), total.scalar(), page, limit, counts.all(),
+                      genres)
+
+    def update(self, obj):
+        pass
+
+    def remove(self, model, id):
+        pass
+
+
+class InMemorySearch(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def _index(self, model):
+        # {"docs": {id: (name, document, genres)},
+        #  "grams": {trigram: {id, ...}}}
+        with self._lock:
+            if model not in self._indexes:
+                index = {"docs": {}, "grams": {}}
+                rows = db.session.query(model.id, model.name, model.city,
+                                        model.state, model.genres)
+                for row in rows:
+                    self._add(index, row)
+                self._indexes[model] = index
+            return self._indexes[model]
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _add(self, index, row):
+        genres = facets.parse(row.genres)
+        doc = ' '.join(f or '' for f in (row.name, row.city, row.state,
+                                         ' '.join(genres)))
+        index["docs"][row.id] = ((row.name or '').lower(), doc.lower(),
+                                 frozenset(genres))
+        for gram in self._trigrams(doc.lower()):
+            index["grams"].setdefault(gram, set()).add(row.id)
+
+    def _discard(self, index, id):
+        entry = index["docs"].pop(id, None)
+        if entry:
+            for gram in self._trigrams(entry[1]):
+                index["grams"].get(gram, set()).discard(id)
+
+    def search(self, model, term, page, limit, genres):
+        index = self._index(model)
+        candidates = index["docs"].keys()
+        grams = self._trigrams(term)
+        if grams:
+            postings = sorted((index["grams"].get(g, set()) for g in grams),
+                              key=len)
+            candidates = set.intersection(*postings)
+
+        wanted = set(genres)
+        ranked = sorted(
+            (_rank(name, term), name, id)
+            for id, (name, doc, tags) in
+            ((id, index["docs"][id]) for id in candidates)
+            if term in doc and wanted <= tags)
+        ids = [id for _, _, id in ranked[(page - 1) * limit:page * limit]]
+        counts = facets.count(index["docs"][id][2] for _, _, id in ranked)
+
+        rows = {}
+        if ids:
+            rows = {r.id: r for r in
+                    _counts_query(model).filter(model.id.in_(ids))}
+        return result([rows[id] for id in ids if id in rows],
+                      len(ranked), page, limit, counts, genres)
+
+    def update(self, obj):
+        model = type(obj)
+        with self._lock:
+            index = self._indexes.get(model)
+            if index is not None:
+                self._discard(index, obj.id)
+                self._add(index, obj)
+
+    def remove(self, model, id):
+        with self._lock:
+            index = self._indexes.get(model)
+            if index is not None:
+                self._discard(index, id)
+
+
+def _backend():
+    backend = current_app.extensions.get('search')
+    if backend is None:
+        if db.engine.dialect.name == 'postgresql':
+            backend = PostgresSearch()
+        else:
+            backend = InMemorySearch()
+        current_app.extensions['search'] = backend
+    return backend
+
+
+def _args(kind, term, page, limit, genres):
+    return (KINDS[kind], (term or '').strip().lower(), max(1, page),
+            limit or current_app.config['SEARCH_PAGE_SIZE'],
+            facets.parse(genres or ()))
+
+
+def search(kind, term, page=1, limit=None, genres=()):
+    return _backend().search(*_args(kind, term, page, limit, genres))
+
+
+def search_queries(kind, term, page=1, limit=None, genres=()):
+    """(count query, rows query, genre counts query, page, limit, genres)
+    for the SQL backend, to run them some other way than search() does
+    (see asgi.py) and pass the results to result(); None for the in-memory
+    index."""
+    backend = _backend()
+    if not hasattr(backend, 'queries'):
+        return None
+    model, term, page, limit, genres = _args(kind, term, page, limit, genres)
+    return backend.queries(model, term, page, limit, genres) + \
+        (page, limit, genres)
+
+
+def index(obj):
+    # Call after a venue/artist is created or edited (once it has an id)
+    _backend().update(obj)
+
+
+def unindex(model, id):
+    _backend().remove(model, id)
@@ -0,0 +1,69 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app  # noqa: E402
+from models import db, Artist, Venue, Show  # noqa: E402
+import areas  # noqa: E402
+import counters  # noqa: E402
+import facets  # noqa: E402
+
+GENRES = ['Jazz', 'Folk', 'Punk']
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """A fresh app on its own SQLite file, tables created:
+    make_app(name='db', **config overrides)."""
+
+    def make(name='db', **config):
+        app = create_app(dict({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(
+                tmp_path / (name + '.sqlite')),
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'CACHE_BACKEND': 'none',
+            'THUMBNAIL_FETCHER': 'none',
+            'TEMPLATE_CACHE_DIR': '',
+            'ERROR_LOG': '',
+            'STREAM_LISTINGS': False,
+        }, **config))
+        with app.app_context():
+            db.create_all()
+        return app
+    return make
+
+
+def seed(app, venues, artists=None, shows_per_venue=2):
+    """venues venues and artists artists (as many as venues by default), in
+    a few cities, each venue with past and upcoming shows."""
+    artists = venues if artists is None else artists
+    now, stamp = datetime.now(), datetime.utcnow()
+    with app.app_context():
+        connection = db.session.connection()
+        connection.execute(Venue.__table__.insert(), [dict(
+            id=i, name='Blue Venue {}'.format(i), city='City {}'.format(i % 7),
+            state='CA', genres=GENRES[:1 + i % 3], updated_at=stamp)
+            for i in range(1, venues + 1)])
+        connection.execute(Artist.__table__.insert(), [dict(
+            id=i, name='Blue Artist {}'.format(i), city='City 1', state='CA',
+            genres=','.join(GENRES[:1 + i % 3]), updated_at=stamp)
+            for i in range(1, artists + 1)])
+        rows = []
+        for v in range(1, venues + 1):
+            for n in range(shows_per_venue):
+                start = now + timedelta(days=(n - shows_per_venue // 2) * 7 + 1)
+                rows.append(dict(venue_id=v, artist_id=(v + n) % artists + 1,
+                                 start_time=start, updated_at=stamp,
+                                 counted_past=counters.is_past(start, now)))
+        if rows:
+            connection.execute(Show.__table__.insert(), rows)
+        for model, key in counters.TARGETS:
+            counters.fix(model, key)
+        areas.rebuild(now)
+        for model in (Venue, Artist):
+            facets.rebuild(model)
+        db.session.commit()
+    return app
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+import pytest
+from conftest import seed
+from instrumentation import QueryRecorder
+from models import Show
+import config
+import dbpool
+
+
+def _batch(n):
+    start = datetime.now() + timedelta(days=3)
+    return {"shows": [{"artist_id": i % 10 + 1, "venue_id": i % 7 + 1,
+                       "start_time": (start + timedelta(hours=i)).isoformat()}
+                      for i in range(n)]}
+
+
+def test_batch_statement_count_is_pinned(make_app):
+    # Lookups, id allocation, one executemany each for the counters and
+    # the insert, the area summary: the same statements for any batch size
+    counts = []
+    for n in (3, 60):
+        app = seed(make_app('db{}'.format(n)), 10)
+        client = app.test_client()
+        with QueryRecorder(max_repeats=1) as recorded:
+            response = client.post('/api/v1/shows/batch', json=_batch(n))
+        assert response.status_code == 201
+        assert response.get_json()["created"] == n
+        with app.app_context():
+            assert Show.query.count() == 20 + n
+        counts.append(recorded.count)
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.parametrize('uri, mode', [
+    ('postgresql://u@localhost/fyyur', 'values'),
+    ('postgres://u@localhost/fyyur', 'values'),
+    ('postgresql+psycopg2://u@localhost/fyyur', 'values'),
+    ('postgresql+pg8000://u@localhost/fyyur', None),
+])
+def test_postgres_executemany_is_batched(uri, mode):
+    settings = {k: getattr(config, k) for k in dir(config) if k.isupper()}
+    options = dbpool.engine_options(dict(settings,
+                                         SQLALCHEMY_DATABASE_URI=uri))
+    assert options.get('executemany_mode') == mode
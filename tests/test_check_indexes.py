@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+from conftest import seed
+from models import db, Show, Venue
+import cli
+import counters
+import queries
+
+
+def test_check_indexes_passes(make_app):
+    app = seed(make_app(), 20)
+    result = app.test_cli_runner().invoke(cli.check_indexes)
+    assert result.exit_code == 0, result.output
+    assert 'rollover: ok' in result.output
+    assert 'ix_Show_rollover' in result.output
+    for name in ('show_venue', 'show_artist', 'venue_version',
+                 'artist_version', 'venues_version', 'shows'):
+        assert '{}: ok'.format(name) in result.output
+
+
+def test_check_indexes_runs_the_real_queries(make_app, monkeypatch):
+    # A detail-page query that scans Show fails the command
+    def nested(venue_id):
+        return Venue.query.options(
+            joinedload(Venue.shows).joinedload(Show.artists, innerjoin=True))\
+            .filter(Venue.id == venue_id)
+
+    monkeypatch.setattr(queries, 'venue_with_shows_query', nested)
+    app = seed(make_app(), 20)
+    result = app.test_cli_runner().invoke(cli.check_indexes)
+    assert result.exit_code == 1
+    assert 'show_venue: FULL SCAN' in result.output
+
+
+def test_rollover_reads_its_partial_index(make_app):
+    app = seed(make_app(), 20)
+    later = datetime.now() + timedelta(days=365)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            plan = cli._explain(connection, counters.pending(later, 1000))
+        assert any('ix_Show_rollover' in line for line in plan), plan
+
+        upcoming = Show.query.filter(Show.counted_past.is_(False)).count()
+        assert upcoming and counters.rollover(later) == upcoming
+        assert counters.pending(later, 1000).count() == 0
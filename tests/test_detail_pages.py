@@ -0,0 +1,58 @@
+import pytest
+from instrumentation import QueryRecorder
+from models import db, Show
+from conftest import seed
+import cli
+import queries
+
+PAGES = ['/venues/{}', '/artists/{}']
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_detail_page_query_count_is_pinned(make_app, page):
+    # One validator query (ETag/Last-Modified) and one for the page itself,
+    # however many shows the venue/artist has
+    for name, shows in (('few', 2), ('many', 40)):
+        client = seed(make_app(name), 10, shows_per_venue=shows).test_client()
+        with QueryRecorder() as recorded:
+            response = client.get(page.format(1))
+        assert response.status_code == 200
+        assert recorded.count == 2
+
+
+def test_detail_pages_skip_shows_without_venue_or_artist(make_app):
+    app = seed(make_app(), 5, shows_per_venue=4)
+    with app.app_context():
+        show = Show.query.filter(Show.venue_id == 1).first()
+        artist_id = show.artist_id
+        other = Show.query.filter(Show.venue_id != 1,
+                                  Show.artist_id != artist_id).first()
+        venue_id = other.venue_id
+        # what deleting a venue/artist leaves behind
+        show.venue_id = None
+        other.artist_id = None
+        db.session.commit()
+
+    client = app.test_client()
+    assert client.get('/artists/{}'.format(artist_id)).status_code == 200
+    assert client.get('/venues/{}'.format(venue_id)).status_code == 200
+
+    # Same shows as the per-side queries asgi.py runs
+    with app.app_context():
+        for entity, other, split_query in (
+                (queries.artist_with_shows(artist_id), 'venues',
+                 lambda upcoming: queries.artist_shows_query(artist_id, upcoming)),
+                (queries.venue_with_shows(venue_id), 'artists',
+                 lambda upcoming: queries.venue_shows_query(venue_id, upcoming))):
+            past, upcoming = queries.split_shows(entity.shows, other=other)
+            assert len(past) == split_query(False).count()
+            assert len(upcoming) == split_query(True).count()
+
+
+@pytest.mark.parametrize('query', [queries.venue_with_shows_query,
+                                   queries.artist_with_shows_query])
+def test_detail_page_query_reads_shows_by_index(make_app, query):
+    app = seed(make_app(), 10)
+    with app.app_context(), db.engine.connect() as connection:
+        plan = cli._explain(connection, query(1))
+    assert not [l for l in plan if cli._is_full_scan(l, 'Show')], plan
@@ -0,0 +1,63 @@
+import json
+import pytest
+from models import db, ImportState, Show, Venue
+from importer import Importer
+
+
+def test_bad_show_rows_are_rejected_not_fatal(make_app, tmp_path):
+    app = make_app()
+    venues = tmp_path / 'venues.jsonl'
+    artists = tmp_path / 'artists.jsonl'
+    shows = tmp_path / 'shows.jsonl'
+    venues.write_text(json.dumps({"id": 'v1', "name": 'Hall', "city": 'Austin',
+                                  "state": 'TX', "genres": ['Jazz']}) + '\n')
+    artists.write_text(json.dumps({"id": 'a1', "name": 'Band',
+                                   "genres": 'Jazz'}) + '\n')
+    shows.write_text('\n'.join(json.dumps(row) for row in [
+        {"venue_id": 'v1', "artist_id": 'a1', "start_time": 'not a date'},
+        {"venue_id": 'v1', "artist_id": 'a1', "start_time": '99999-99-99'},
+        {"venue_id": 'v1', "artist_id": 'a1', "start_time": 12},
+        {"venue_id": 'v1', "artist_id": 'nobody', "start_time": '2030-01-01'},
+        {"venue_id": 'v1', "artist_id": 'a1', "start_time": '2030-01-01 20:00'},
+    ]) + '\n')
+
+    with app.app_context():
+        importer = Importer('test', batch_size=2, echo=lambda line: None)
+        importer.run(venues=[str(venues)], artists=[str(artists)])
+        with db.engine.connect() as importer.connection:
+            assert importer.load('show', str(shows)) == (1, 4)
+        assert Show.query.count() == 1
+
+
+def test_resume_after_a_crash_loads_no_row_twice(make_app, tmp_path,
+                                                 monkeypatch):
+    app = make_app()
+    venues = tmp_path / 'venues.jsonl'
+    venues.write_text('\n'.join(json.dumps(
+        {"id": 'v{}'.format(i), "name": 'Hall {}'.format(i),
+         "city": 'Austin', "state": 'TX'}) for i in range(7)) + '\n')
+
+    # dies while saving the second batch's progress: that batch must not
+    # stay committed without it
+    save, calls = Importer._save_state, []
+
+    def failing(self):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError('crash')
+        save(self)
+
+    with app.app_context():
+        monkeypatch.setattr(Importer, '_save_state', failing)
+        with pytest.raises(RuntimeError):
+            Importer('test', batch_size=2, echo=lambda line: None).run(
+                venues=[str(venues)])
+        assert Venue.query.count() == 2
+        monkeypatch.setattr(Importer, '_save_state', save)
+
+        Importer('test', batch_size=2, echo=lambda line: None).run(
+            venues=[str(venues)])
+        assert sorted(name for name, in db.session.query(Venue.name)) == \
+            sorted('Hall {}'.format(i) for i in range(7))
+        state = json.loads(ImportState.query.get('test').state)
+        assert sorted(state["venue"]) == ['v{}'.format(i) for i in range(7)]
@@ -0,0 +1,17 @@
+import pytest
+
+PATHS = ['/internal/pool', '/internal/cache']
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_hidden_by_default(make_app, path):
+    assert make_app().test_client().get(path).status_code == 404
+
+
+@pytest.mark.parametrize('config', [{'EXPOSE_INTERNAL_STATS': True},
+                                    {'DEBUG': True}])
+@pytest.mark.parametrize('path', PATHS)
+def test_exposed_when_asked(make_app, path, config):
+    response = make_app(**config).test_client().get(path)
+    assert response.status_code == 200
+    assert response.is_json
@@ -0,0 +1,24 @@
+import pytest
+from instrumentation import QueryRecorder
+from conftest import seed
+
+ROUTES = [
+    ('GET', '/venues', None),
+    ('POST', '/venues/search', {'search_term': 'blue'}),
+    ('POST', '/artists/search', {'search_term': 'blue'}),
+]
+
+
+def _count(app, method, path, data):
+    client = app.test_client()
+    with QueryRecorder(max_repeats=1) as queries:
+        response = client.open(path, method=method, data=data)
+    assert response.status_code == 200
+    return queries.count
+
+
+@pytest.mark.parametrize('method, path, data', ROUTES)
+def test_query_count_does_not_grow_with_venues(make_app, method, path, data):
+    small = seed(make_app('small'), 20)
+    large = seed(make_app('large'), 200)
+    assert _count(small, method, path, data) == _count(large, method, path, data)
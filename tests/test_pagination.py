@@ -0,0 +1,37 @@
+import pytest
+from conftest import seed
+from models import db, Show
+
+
+def _html_page(response):
+    body = response.get_data(True)
+    marker = 'class="next"><a href="'
+    url = None
+    if marker in body:
+        url = body.split(marker, 1)[1].split('"', 1)[0].replace('&amp;', '&')
+    return body.count('tile-show'), url
+
+
+def _api_page(response):
+    page = response.get_json()
+    url = '/api/v1/shows?limit=4&after=' + page['next'] if page['next'] else None
+    return len(page['data']), url
+
+
+@pytest.mark.parametrize('path, read', [('/shows', _html_page),
+                                        ('/api/v1/shows', _api_page)])
+def test_shows_page_past_a_show_without_start_time(make_app, path, read):
+    app = seed(make_app(), 10)
+    with app.app_context():
+        Show.query.get(3).start_time = None
+        db.session.commit()
+        total = Show.query.filter(Show.start_time.isnot(None)).count()
+
+    client = app.test_client()
+    seen, url = 0, path + '?limit=4'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, url
+        count, url = read(response)
+        seen += count
+    assert seen == total
@@ -0,0 +1,80 @@
+import http.server
+import threading
+import pytest
+from conftest import seed
+from models import db, Venue
+import thumbnails
+from thumbnails import ThumbnailError, UrllibFetcher
+
+
+@pytest.fixture
+def local_server():
+    # An "internal" service: anything on loopback
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/redirect':
+                self.send_response(302)
+                self.send_header('Location', 'http://127.0.0.1:{}/'.format(
+                    self.server.server_port))
+            else:
+                self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,),
+                     daemon=True).start()
+    yield server.server_port
+    server.shutdown()
+
+
+@pytest.mark.parametrize('link', [
+    'http://127.0.0.1:{port}/',
+    'http://localhost:{port}/',
+    'http://[::1]:{port}/',
+    'http://10.0.0.1:{port}/',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://0.0.0.0:{port}/',
+    'file:///etc/passwd',
+])
+def test_fetcher_refuses_internal_links(local_server, link):
+    with pytest.raises(ThumbnailError):
+        UrllibFetcher(timeout=1).fetch(link.format(port=local_server))
+
+
+def test_fetcher_checks_redirects(local_server, monkeypatch):
+    # The first hop passes as public; the redirect to loopback must not
+    checked = []
+
+    def public_address(host, port):
+        checked.append(host)
+        if len(checked) == 1:
+            return '127.0.0.1', port
+        return real(host, port)
+
+    real = thumbnails._public_address
+    monkeypatch.setattr(thumbnails, '_public_address', public_address)
+    with pytest.raises(ThumbnailError):
+        UrllibFetcher(timeout=1).fetch(
+            'http://fyyur.test:{}/redirect'.format(local_server))
+    assert checked == ['fyyur.test', '127.0.0.1']
+
+
+def test_cache_miss_redirects_and_fills_later(make_app, monkeypatch):
+    pytest.importorskip('PIL')
+    app = seed(make_app(THUMBNAIL_FETCHER='stub'), 1)
+    with app.app_context():
+        link = 'https://images.example.com/venue.png'
+        Venue.query.get(1).image_link = link
+        db.session.commit()
+    later = []
+    thumbnailer = app.extensions['thumbnails']
+    monkeypatch.setattr(thumbnailer, 'fill', lambda link: later.append(link))
+
+    response = app.test_client().get('/venues/1/image/tile')
+    assert response.status_code == 302
+    assert response.headers['Location'] == link
+    thumbnailer._executor.shutdown()
+    assert later == [link]
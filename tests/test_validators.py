@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+import re
+import pytest
+from models import db, Artist, Show, Venue
+from conftest import seed
+import cli
+import queries
+
+LISTINGS = {
+    '/venues': (Venue, Show),
+    '/artists': (Artist,),
+    '/shows': (Show, Venue, Artist),
+}
+
+
+def test_listing_etag_changes_when_a_venue_is_deleted(make_app):
+    # No shows, so no Show row changes with the venue: only the deletion
+    # stamp delete_venue writes can change the ETag
+    app = seed(make_app(), 10, shows_per_venue=0)
+    client = app.test_client()
+    before = client.get('/venues')
+    etag = before.headers['ETag']
+    assert client.get('/venues', headers={'If-None-Match': etag}).status_code == 304
+
+    assert client.delete('/venues/3').status_code == 204
+    assert client.delete('/venues/3').status_code == 404
+
+    after = client.get('/venues', headers={'If-None-Match': etag})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != etag
+
+
+def test_last_modified_is_utc(make_app):
+    app = seed(make_app(), 5)
+    # werkzeug parses it back as naive UTC
+    last_modified = app.test_client().get('/artists').last_modified
+    assert abs(datetime.utcnow() - last_modified) < timedelta(minutes=1)
+
+
+@pytest.mark.parametrize('path', sorted(LISTINGS))
+def test_listing_validator_reads_no_table_in_full(make_app, path):
+    app = seed(make_app(), 10)
+    with app.app_context(), db.engine.connect() as connection:
+        plan = cli._explain(connection,
+                            queries.listing_version_query(*LISTINGS[path]))
+    for model in LISTINGS[path]:
+        assert not [l for l in plan if cli._is_full_scan(l, model.__tablename__)], plan
+
+
+def test_cached_page_follows_a_show_into_the_past(make_app, monkeypatch):
+    # No write and no invalidate when a show starts: only the validator
+    # changes, and the cached page must not be served under it
+    app = seed(make_app(CACHE_BACKEND='lru'), 1)
+    client = app.test_client()
+
+    def counts(response):
+        return re.findall(r'(\d+) (Upcoming|Past)', response.get_data(True))
+
+    before = client.get('/venues/1')
+    assert counts(before) == [('1', 'Upcoming'), ('1', 'Past')]
+    assert client.get('/venues/1').headers['X-Cache'] == 'HIT'
+
+    class Later(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(days=2)
+
+    monkeypatch.setattr(queries, 'datetime', Later)
+    after = client.get('/venues/1')
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert after.headers['X-Cache'] == 'MISS'
+    assert counts(after) == [('0', 'Upcoming'), ('2', 'Past')]
+    assert client.get('/venues/1', headers={
+        'If-None-Match': after.headers['ETag']}).status_code == 304
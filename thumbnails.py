@@ -0,0 +1,425 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import (HTTPDefaultErrorHandler, HTTPErrorProcessor,
+                            HTTPHandler, HTTPRedirectHandler, HTTPSHandler,
+                            OpenerDirector, Request, UnknownHandler)
+from flask import abort, current_app, redirect, request, send_file, url_for
+from models import db, Artist, Venue
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+
+#----------------------------------------------------------------------------#
+# Thumbnails.
+#----------------------------------------------------------------------------#
+
+# Venue and artist images are third-party URLs (image_link). Pages link to
+# /venues/<id>/image/<size> (/artists/...) instead: the first request for
+# an image_link fetches it once, through a pluggable fetcher, and stores
+# every size in WebP and JPEG in a disk cache bounded to
+# THUMBNAIL_CACHE_BYTES. Later requests are served from there. Links carry
+# ?v=<hash of image_link>, so a link that changes gets a new URL and the
+# old one can be cached for good. Editing a venue or artist's image_link
+# fetches the new one in the background. Until an image is cached, and if
+# its fetch fails, the route redirects to the original image.
+#
+# image_link is user input, so the HTTP fetcher only connects to public
+# addresses: every connection, redirects included, goes to an address
+# checked after resolving the host, and no proxy is used.
+#
+# THUMBNAIL_FETCHER: 'urllib' (HTTP), 'stub' (no network, a flat image per
+# link, for development and benchmarks) or 'none' to link image_link
+# directly, as does a missing Pillow.
+
+logger = logging.getLogger(__name__)
+
+# (width, height) boxes, aspect ratio kept: tiles on the listing and detail
+# pages and the main image of a detail page, both at 2x for dense screens
+SIZES = {'tile': (400, 400), 'page': (1000, 1000)}
+MIMETYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+KINDS = {'venues': Venue, 'artists': Artist}
+VERSION_LENGTH = 12
+MAX_AGE = 365 * 24 * 3600
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def link_key(link):
+    return hashlib.sha256(link.encode('utf-8')).hexdigest()
+
+
+#  Fetchers
+#  ----------------------------------------------------------------
+
+
+def _public_address(host, port):
+    # The first address host resolves to, refusing hosts that resolve to
+    # any internal one
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError) as e:
+        raise ThumbnailError('{}: {}'.format(host, e))
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if getattr(address, 'ipv4_mapped', None):
+            address = address.ipv4_mapped
+        if address.is_loopback or address.is_private or \
+                address.is_link_local or address.is_reserved or \
+                address.is_multicast or address.is_unspecified:
+            raise ThumbnailError('{}: not a public address ({})'
+                                 .format(host, address))
+    return addresses[0][4][:2]
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                    source_address=None):
+    # socket.create_connection(), to the address checked above rather than
+    # one the host might resolve to next time
+    return socket.create_connection(_public_address(*address), timeout,
+                                    source_address)
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, *args, **kwargs):
+        super(_PublicHTTPConnection, self).__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    # TLS still checks the certificate against the host name
+
+    def __init__(self, *args, **kwargs):
+        super(_PublicHTTPSConnection, self).__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPHandler(HTTPHandler):
+
+    def do_open(self, http_class, req, **kwargs):
+        return super(_PublicHTTPHandler, self).do_open(
+            _PublicHTTPConnection, req, **kwargs)
+
+
+class _PublicHTTPSHandler(HTTPSHandler):
+
+    def do_open(self, http_class, req, **kwargs):
+        return super(_PublicHTTPSHandler, self).do_open(
+            _PublicHTTPSConnection, req, **kwargs)
+
+
+class _RedirectHandler(HTTPRedirectHandler):
+    # Redirects to http(s) only; their connections are checked like the
+    # first one
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not newurl.startswith(('http://', 'https://')):
+            raise ThumbnailError('redirect to a non-http(s) link: {}'
+                                 .format(newurl))
+        return super(_RedirectHandler, self).redirect_request(
+            req, fp, code, msg, headers, newurl)
+
+
+def _public_opener():
+    # build_opener() without the proxy, file, ftp and data handlers
+    opener = OpenerDirector()
+    for handler in (_PublicHTTPHandler(), _PublicHTTPSHandler(),
+                    _RedirectHandler(), HTTPDefaultErrorHandler(),
+                    HTTPErrorProcessor(), UnknownHandler()):
+        opener.add_handler(handler)
+    return opener
+
+
+class UrllibFetcher(object):
+    # Plain HTTP(S) GET from public addresses, bounded in time and size
+
+    def __init__(self, timeout=5, max_bytes=10 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.opener = _public_opener()
+
+    def fetch(self, link):
+        if not link.startswith(('http://', 'https://')):
+            raise ThumbnailError('not an http(s) link: {}'.format(link))
+        try:
+            with self.opener.open(Request(link, headers={'User-Agent': 'fyyur'}),
+                                  timeout=self.timeout) as response:
+                data = response.read(self.max_bytes + 1)
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            raise ThumbnailError('{}: {}'.format(link, e))
+        if len(data) > self.max_bytes:
+            raise ThumbnailError('{}: over {} bytes'.format(link, self.max_bytes))
+        return data
+
+
+class StubFetcher(object):
+    # No network: a flat image coloured after the link
+
+    def __init__(self, timeout=None, max_bytes=None):
+        pass
+
+    def fetch(self, link):
+        colour = tuple(hashlib.sha256(link.encode('utf-8')).digest()[:3])
+        out = io.BytesIO()
+        Image.new('RGB', (1200, 800), colour).save(out, 'PNG')
+        return out.getvalue()
+
+
+FETCHERS = {'urllib': UrllibFetcher, 'stub': StubFetcher}
+
+
+def render(data, formats):
+    # {(size, format): bytes} for every size and format
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG sources are decoded straight at a fraction of their size
+        image.draft('RGB', max(SIZES.values()))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ThumbnailError('not an image: {}'.format(e))
+
+    variants = {}
+    for size, box in SIZES.items():
+        thumb = image.copy()
+        thumb.thumbnail(box)
+        if thumb.mode not in ('RGB', 'RGBA'):
+            thumb = thumb.convert('RGBA')
+        for format in formats:
+            out = io.BytesIO()
+            if format == 'jpeg':
+                flat = thumb
+                if thumb.mode == 'RGBA':
+                    flat = Image.new('RGB', thumb.size, 'white')
+                    flat.paste(thumb, mask=thumb.split()[-1])
+                flat.save(out, 'JPEG', quality=80, optimize=True,
+                          progressive=True)
+            else:
+                thumb.save(out, 'WEBP', quality=80, method=4)
+            variants[size, format] = out.getvalue()
+    return variants
+
+
+#  Disk cache
+#  ----------------------------------------------------------------
+
+
+class DiskCache(object):
+    # Files under directory/<key[:2]>/<key>.<size>.<format>, evicted least
+    # recently used first (by mtime, which hits refresh at most hourly)
+    # once the total passes max_bytes. Each process keeps a running total
+    # and rescans the directory when it evicts.
+
+    touch_after = 3600
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None
+
+    def path(self, key, size, format):
+        return os.path.join(self.directory, key[:2],
+                            '{}.{}.{}'.format(key, size, format))
+
+    def get(self, key, size, format):
+        path = self.path(key, size, format)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - mtime > self.touch_after:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return path
+
+    def put(self, key, variants):
+        written = 0
+        for (size, format), data in variants.items():
+            path = self.path(key, size, format)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            written += len(data)
+
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._files())
+            else:
+                self._total += written
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _evict(self):
+        # Down to 90% of the bound, so the next few writes don't rescan
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total = total
+
+
+#  Extension
+#  ----------------------------------------------------------------
+
+
+class Thumbnailer(object):
+
+    def __init__(self, cache, fetcher, formats):
+        self.cache = cache
+        self.fetcher = fetcher
+        self.formats = formats
+        self._lock = threading.Lock()
+        self._filling = {}
+        self._queued = set()
+        self._executor = None
+
+    def fill(self, link):
+        # Fetch and store every variant of link; one fetch per link at a
+        # time in this process
+        key = link_key(link)
+        with self._lock:
+            lock = self._filling.setdefault(key, threading.Lock())
+        with lock:
+            try:
+                if self.cache.get(key, 'tile', 'jpeg') is None:
+                    self.cache.put(key, render(self.fetcher.fetch(link),
+                                               self.formats))
+            finally:
+                with self._lock:
+                    self._filling.pop(key, None)
+        return key
+
+    def fill_later(self, link):
+        # Once per link until that fill is done, however many misses ask
+        with self._lock:
+            if link in self._queued:
+                return
+            self._queued.add(link)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    2, thread_name_prefix='thumbnails')
+        self._executor.submit(self._fill_logged, link)
+
+    def _fill_logged(self, link):
+        try:
+            self.fill(link)
+        except ThumbnailError as e:
+            logger.warning('thumbnail fetch failed: %s', e)
+        except Exception:
+            logger.exception('thumbnail fetch failed: %s', link)
+        finally:
+            with self._lock:
+                self._queued.discard(link)
+
+
+class Thumbnails(object):
+
+    def init_app(self, app):
+        app.config.setdefault('THUMBNAIL_FETCHER', 'urllib')
+        app.config.setdefault('THUMBNAIL_DIR', 'thumbnails')
+        app.config.setdefault('THUMBNAIL_CACHE_BYTES', 256 * 1024 * 1024)
+        app.config.setdefault('THUMBNAIL_FETCH_TIMEOUT', 5)
+        app.config.setdefault('THUMBNAIL_MAX_SOURCE_BYTES', 10 * 1024 * 1024)
+
+        kind = app.config['THUMBNAIL_FETCHER']
+        if kind == 'none' or Image is None:
+            app.extensions['thumbnails'] = None
+        elif kind in FETCHERS:
+            formats = ['jpeg'] + (['webp'] if features.check('webp') else [])
+            app.extensions['thumbnails'] = Thumbnailer(
+                DiskCache(app.config['THUMBNAIL_DIR'],
+                          app.config['THUMBNAIL_CACHE_BYTES']),
+                FETCHERS[kind](app.config['THUMBNAIL_FETCH_TIMEOUT'],
+                               app.config['THUMBNAIL_MAX_SOURCE_BYTES']),
+                formats)
+        else:
+            raise ValueError('unknown THUMBNAIL_FETCHER: {}'.format(kind))
+
+        app.add_url_rule('/<any(venues, artists):kind>/<int:id>/image/'
+                         '<any(tile, page):size>', 'thumbnail', self.view)
+        app.add_template_global(self.url, 'thumbnail_url')
+
+    @property
+    def thumbnailer(self):
+        return current_app.extensions.get('thumbnails')
+
+    def url(self, kind, id, link, size='tile'):
+        if not link or self.thumbnailer is None:
+            return link
+        return url_for('thumbnail', kind=kind, id=id, size=size,
+                       v=link_key(link)[:VERSION_LENGTH])
+
+    def refresh(self, link):
+        # After image_link changed: fetch it now, off the request
+        if link and self.thumbnailer is not None:
+            self.thumbnailer.fill_later(link)
+
+    def view(self, kind, id, size):
+        model = KINDS[kind]
+        link = db.session.query(model.image_link).filter(model.id == id).scalar()
+        if not link:
+            abort(404)
+        thumbnailer = self.thumbnailer
+        if thumbnailer is None:
+            return redirect(link)
+
+        format = 'jpeg'
+        if 'webp' in thumbnailer.formats and \
+                'image/webp' in request.headers.get('Accept', ''):
+            format = 'webp'
+        key = link_key(link)
+        path = thumbnailer.cache.get(key, size, format)
+        if path is None:
+            # fetched off the request; the original until it is cached
+            thumbnailer.fill_later(link)
+            response = redirect(link)
+            response.headers['Cache-Control'] = 'public, max-age=60'
+            return response
+
+        response = send_file(path, mimetype=MIMETYPES[format], conditional=True)
+        if request.args.get('v') == key[:VERSION_LENGTH]:
+            response.headers['Cache-Control'] = \
+                'public, max-age={}, immutable'.format(MAX_AGE)
+        else:
+            response.headers['Cache-Control'] = 'public, max-age=300'
+        response.headers['Vary'] = 'Accept'
+        return response
+
+
+thumbnails = Thumbnails()
@@ -0,0 +1,57 @@
+import gc
+import logging
+import babel.dates
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import configure_mappers
+from app import create_app, datetime_formatter, DATETIME_FORMATS
+from models import db
+
+
+#----------------------------------------------------------------------------#
+# WSGI entry point.
+#----------------------------------------------------------------------------#
+
+# gunicorn -c gunicorn.conf.py   (preload_app: this module is imported once,
+# in the master, before it forks the workers)
+#
+# Everything a worker would otherwise do on its first requests is done here
+# instead, so the workers start with it in memory they share copy-on-write
+# with the master: templates are compiled (or loaded from the bytecode cache,
+# see `flask compile-templates`), mappers configured, the URL map sorted
+# and the date formats parsed. The database engine connects once, so
+# the dialect reads the server version and settings in the master, and is
+# then disposed: no socket is open at fork time for two processes to share,
+# and each worker opens its own connections on demand. gc.freeze() moves all
+# of it out of the collector's sight, so a collection in a worker doesn't
+# write to (and un-share) every page the master loaded.
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_engines(app):
+    for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or {}):
+        engine = db.get_engine(app, bind=bind)
+        try:
+            engine.connect().close()
+        except DBAPIError as e:
+            # Workers connect on their own once the database is up
+            logger.warning('preload: could not connect (%s): %s',
+                           bind or 'default', e)
+        engine.dispose()
+
+
+def preload(app):
+    with app.app_context():
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+        configure_mappers()
+        app.url_map.update()
+        for format in DATETIME_FORMATS:
+            datetime_formatter(format, babel.dates.LC_TIME or 'en_US')
+        _warm_engines(app)
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+application = preload(create_app())